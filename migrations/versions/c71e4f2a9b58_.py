@@ -0,0 +1,34 @@
+"""empty message
+
+Revision ID: c71e4f2a9b58
+Revises: a3d8e51b7c20
+Create Date: 2026-10-17 12:20:05.734118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e4f2a9b58'
+down_revision = 'a3d8e51b7c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full-text search indexes only exist on Postgres; other databases use the in-process index in src/search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish)")
+    op.execute("ALTER TEXT SEARCH CONFIGURATION es_unaccent ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem")
+    op.execute("CREATE INDEX ix_book_search ON book USING gin (to_tsvector('es_unaccent', title || ' ' || synopsis))")
+    op.execute("CREATE INDEX ix_author_search ON author USING gin (to_tsvector('es_unaccent', name))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX ix_author_search")
+    op.execute("DROP INDEX ix_book_search")
+    op.execute("DROP TEXT SEARCH CONFIGURATION es_unaccent")
@@ -0,0 +1,32 @@
+"""empty message
+
+Revision ID: f3b8c1d27a90
+Revises: d0a5f3e6b218
+Create Date: 2026-10-17 19:02:36.418027
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8c1d27a90'
+down_revision = 'd0a5f3e6b218'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored, so ranking reads the book's tsvector instead of parsing its synopsis again for every match (Postgres 12+)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("ALTER TABLE book ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (to_tsvector('es_unaccent'::regconfig, title || ' ' || synopsis)) STORED")
+    op.execute("CREATE INDEX ix_book_search_vector ON book USING gin (search_vector)")
+    op.execute("DROP INDEX ix_book_search")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE INDEX ix_book_search ON book USING gin (to_tsvector('es_unaccent', title || ' ' || synopsis))")
+    op.execute("DROP INDEX ix_book_search_vector")
+    op.execute("ALTER TABLE book DROP COLUMN search_vector")
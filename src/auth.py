@@ -0,0 +1,69 @@
+"""
+Token authentication for protected routes.
+
+Tokens are verified once and their claims kept in an LRU keyed by the token
+until the token expires, so repeated requests skip the signature check. The
+reader a token belongs to is kept in a short TTL cache instead of being read
+from the database on every request; updates to a reader drop its entry.
+"""
+import os
+import time
+from functools import wraps
+
+import jwt
+from flask import current_app, request
+from sqlalchemy import event
+
+from cache import LRUCache
+from models import db, Reader, schema_columns
+from utils import APIException
+
+TOKEN_HEADER = "x-access-tokens"
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", 1024))
+# Upper bound for a cached token; tokens expiring sooner are dropped at their exp
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", 1800))
+READER_CACHE_MAX_ENTRIES = int(os.environ.get("READER_CACHE_MAX_ENTRIES", 1024))
+READER_CACHE_TTL = int(os.environ.get("READER_CACHE_TTL", 60))
+
+claims_cache = LRUCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL)
+reader_cache = LRUCache(READER_CACHE_MAX_ENTRIES, READER_CACHE_TTL)
+
+def read_claims(token):
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        claims = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        raise APIException("token is invalid", status_code=401)
+    expires_in = claims["exp"] - time.time() if "exp" in claims else None
+    claims_cache.set(token, claims, expires_in)
+    return claims
+
+def read_reader(id_reader):
+    reader = reader_cache.get(id_reader)
+    if reader is None:
+        row = db.session.query(*schema_columns(Reader)).filter_by(id=id_reader).first()
+        if row is None:
+            raise APIException("token is invalid", status_code=401)
+        reader = row._asdict()
+        reader_cache.set(id_reader, reader)
+    return reader
+
+def token_required(f):
+    """Passes the reader the request's token belongs to (a dict of Reader.schema fields) as the first argument."""
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        token = request.headers.get(TOKEN_HEADER)
+        if not token:
+            raise APIException("a valid token is missing", status_code=401)
+        current_reader = read_reader(read_claims(token)["id"])
+        return f(current_reader, *args, **kwargs)
+
+    return decorator
+
+def forget_reader(mapper, connection, target):
+    reader_cache.delete(target.id)
+
+event.listen(Reader, "after_update", forget_reader)
+event.listen(Reader, "after_delete", forget_reader)
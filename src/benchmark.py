@@ -0,0 +1,344 @@
+"""
+End-to-end load benchmark: drives every GET route through the Flask test
+client, from --concurrency threads at once, and writes latency, throughput,
+query count and memory figures as JSON, so runs on the same dataset can be
+compared over time.
+"""
+import datetime
+import heapq
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import click
+from flask import current_app, json as flask_json
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.engine.url import make_url
+
+from models import db, Reader, Author, Book, Review, Shelf, follower, schema_columns, read_rows
+from utils import count_queries, dumps, MAX_PAGE_SIZE
+from generate_data import generate, load_generated_data
+from init_database import load_seed_data, load_seed_data_bulk
+from db_config import engine_options
+import cache
+import passwords
+import search
+import similar_readers
+
+# Extra query strings worth timing on top of the plain routes
+ROUTE_VARIANTS = {
+    "/books": ["?limit=50", "?title=historia", "?sort=top_rated"],
+    "/authors": ["?limit=50", "?name=gar"],
+    "/reviews": ["?limit=50"],
+    "/readers": ["?limit=50"],
+    "/search": ["?q=sombra", "?q=imp"],
+}
+
+def sample_arguments():
+    """Picks real ids to fill route parameters, preferring the busiest rows."""
+    busiest_shelf = db.session.query(Shelf.id_reader, Shelf.shelf_name).group_by(Shelf.id_reader, Shelf.shelf_name).order_by(func.count().desc()).first()
+    most_followed = db.session.query(follower.c.id_followed).group_by(follower.c.id_followed).order_by(func.count().desc()).first()
+    most_reviewed = db.session.query(Review.id_book).group_by(Review.id_book).order_by(func.count().desc()).first()
+    author = Author.query.first()
+    id_reader = most_followed[0] if most_followed else Reader.query.first().id
+    id_book = most_reviewed[0] if most_reviewed else Book.query.first().id
+    reader_id = busiest_shelf[0] if busiest_shelf else id_reader
+    return {
+        "reader_id": reader_id,
+        "shelf_name": busiest_shelf[1] if busiest_shelf else "Leídos",
+        "id_reader": id_reader,
+        "id_other": reader_id,
+        "id_book": id_book,
+        "book_id": id_book,
+        "name_input": author.name if author else "",
+    }
+
+def benchmark_urls(app, arguments):
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if "GET" not in rule.methods or rule.endpoint == "static" or rule.rule.startswith("/admin") or rule.rule == "/":
+            continue
+        url = rule.rule
+        for argument in rule.arguments:
+            url = url.replace(f"<{argument}>", str(arguments[argument])).replace(f"<int:{argument}>", str(arguments[argument]))
+        yield url
+        for variant in ROUTE_VARIANTS.get(rule.rule, []):
+            yield url + variant
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def time_calls(call, repeat):
+    """Returns the latencies in ms of repeat calls and the last result."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, result
+
+def timed_gets(app, url, request_count):
+    """Latencies in ms and the last status of request_count GETs, sent one after the other from a client of their own."""
+    client = app.test_client()
+    latencies = []
+    status = None
+    for _ in range(request_count):
+        started = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        latencies.append((time.perf_counter() - started) * 1000)
+        status = response.status_code
+    return latencies, status
+
+def run_benchmark(app, request_count, concurrency=1):
+    engine = db.engine
+    results = []
+    # Like the threads of a gthread worker, the clients share the app and its connection pool
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for url in benchmark_urls(app, sample_arguments()):
+            shares = [request_count // concurrency + (client < request_count % concurrency) for client in range(concurrency)]
+            with count_queries(engine) as statements:
+                started = time.perf_counter()
+                runs = list(executor.map(lambda share: timed_gets(app, url, share), [share for share in shares if share]))
+                elapsed = time.perf_counter() - started
+            latencies = [latency for run_latencies, _ in runs for latency in run_latencies]
+            results.append({
+                "url": url,
+                "status": runs[-1][1],
+                "cold_ms": round(runs[0][0][0], 3),
+                "p50_ms": round(percentile(latencies, 0.5), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "requests_per_second": round(request_count / elapsed, 1),
+                "queries_per_request": round(len(statements) / request_count, 2),
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            })
+            print(f'{url}: p50 {results[-1]["p50_ms"]} ms, p99 {results[-1]["p99_ms"]} ms, {results[-1]["requests_per_second"]} requests/s, {results[-1]["queries_per_request"]} queries')
+    return results
+
+@click.command("benchmark")
+@click.option("--requests", "request_count", default=50, show_default=True, help="Requests sent to each URL.")
+@click.option("--concurrency", default=1, show_default=True, help="Requests in flight at once, as the threads of one gunicorn worker (GUNICORN_THREADS).")
+@click.option("--output", default="benchmark.json", show_default=True, help="File the JSON report is written to.")
+@with_appcontext
+def benchmark(request_count, concurrency, output):
+    """Latency and throughput of every GET route; compare runs with different DB_POOL_SIZE and --concurrency."""
+    pool = db.engine.pool
+    report = {
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "database": db.engine.dialect.name,
+        "requests_per_url": request_count,
+        "concurrency": concurrency,
+        "pool": {"class": type(pool).__name__, "size": pool.size() if hasattr(pool, "size") else None},
+        "rows": {model.__tablename__: model.query.count() for model in (Reader, Author, Book, Review, Shelf)},
+        "results": run_benchmark(current_app._get_current_object(), request_count, concurrency),
+    }
+    with open(output, "w") as report_file:
+        json.dump(report, report_file, indent=2, ensure_ascii=False)
+    print(f"Report written to {output}")
+
+@contextmanager
+def scratch_database(database_uri=None):
+    """
+    Points db at database_uri, or at a temporary SQLite file, for the block,
+    with no read replicas. Benchmarks that drop and create tables run inside
+    it, so they never touch the application's databases, whose migration-only
+    objects create_all would not bring back.
+    """
+    config = current_app.config
+    application_uris = [config["SQLALCHEMY_DATABASE_URI"], *(config.get("SQLALCHEMY_BINDS") or {}).values()]
+    if database_uri and any(uri and make_url(uri) == make_url(database_uri) for uri in application_uris):
+        raise click.BadParameter("is a database of the application; pass a scratch database", param_hint="--database-uri")
+    directory = None
+    if not database_uri:
+        directory = tempfile.mkdtemp()
+        database_uri = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+    saved = {key: config.get(key) for key in ("SQLALCHEMY_DATABASE_URI", "SQLALCHEMY_ENGINE_OPTIONS", "SQLALCHEMY_BINDS")}
+    db.session.remove()
+    config.update(SQLALCHEMY_DATABASE_URI=database_uri, SQLALCHEMY_ENGINE_OPTIONS=engine_options(database_uri), SQLALCHEMY_BINDS={})
+    try:
+        yield
+    finally:
+        db.session.remove()
+        db.engine.dispose()
+        config.update(saved)
+        if directory:
+            shutil.rmtree(directory)
+
+database_uri_option = click.option(
+    "--database-uri", help="Scratch database whose tables are dropped and recreated; the application's databases are refused. Defaults to a temporary SQLite file."
+)
+
+@click.command("benchmark-catalog")
+@click.option("--sizes", default="10000,50000,100000", show_default=True, help="Comma separated catalog sizes, in books.")
+@click.option("--requests", "request_count", default=5, show_default=True, help="Requests sent to /books at each size.")
+@database_uri_option
+@with_appcontext
+def benchmark_catalog(sizes, request_count, database_uri):
+    """GET /books latency at each catalog size, on a freshly generated dataset in a scratch database; time per book should stay flat."""
+    with scratch_database(database_uri):
+        run_catalog_benchmark([int(size) for size in sizes.split(",")], request_count)
+
+def run_catalog_benchmark(sizes, request_count):
+    client = current_app.test_client()
+    for size in sizes:
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        # Reviews feed the rating columns of the listing; shelves and follows don't take part in it
+        load_generated_data(readers=1000, authors=max(200, size // 50), books=size, reviews=size, shelf_entries=0, follows=0)
+        latencies = []
+        queries = []
+        for _ in range(request_count):
+            # Every request is built from the database, not from the response cache
+            cache.clear()
+            with count_queries(db.engine) as statements:
+                started = time.perf_counter()
+                response = client.get("/books")
+                response.get_data()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(statements))
+        p50 = percentile(latencies, 0.5)
+        print(f"{size} books: p50 {p50:.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, {p50 / size * 1000:.2f} ms per 1000 books, {max(queries)} queries, status {response.status_code}")
+
+LOADERS = {
+    "row by row": lambda data, batch_size: load_seed_data(data),
+    "batched": lambda data, batch_size: load_seed_data_bulk(data, batch_size),
+    "COPY": lambda data, batch_size: load_seed_data_bulk(data, batch_size, use_copy=True),
+}
+
+@click.command("benchmark-loading")
+@click.option("--books", default=2000, show_default=True, help="Books generated; the other tables are sized from it.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per INSERT batch of the batched and COPY loaders.")
+@database_uri_option
+@with_appcontext
+def benchmark_loading(books, batch_size, database_uri):
+    """Rows/s of flask init-db row by row, with --bulk and with --bulk --copy, each into empty tables of a scratch database."""
+    data = generate(readers=max(100, books // 4), authors=max(50, books // 20), books=books, reviews=books * 2, shelf_entries=books * 2, follows=books)
+    rows = sum(len(table_rows) for table_rows in data.values())
+    results = []
+    with scratch_database(database_uri):
+        for name, load in LOADERS.items():
+            if name == "COPY" and db.engine.dialect.name != "postgresql":
+                print("COPY skipped: it only runs on Postgres")
+                continue
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            load(data, batch_size)
+            elapsed = time.perf_counter() - started
+            results.append(f"{name}: {rows} rows in {elapsed:.2f} s, {rows / elapsed:.0f} rows/s")
+    for result in results:
+        print(result)
+
+@click.command("benchmark-passwords")
+@click.option("--hasher", "hasher_name", type=click.Choice(sorted(passwords.HASHERS)), default=passwords.PASSWORD_HASHER, show_default=True)
+@click.option("--costs", default="50000,150000,300000", show_default=True, help="Comma separated work factors to compare.")
+@click.option("--logins", default=50, show_default=True, help="Password checks timed per cost.")
+def benchmark_passwords(hasher_name, costs, logins):
+    """Login throughput of one worker (its password hashing pool) at each work factor."""
+    for cost in costs.split(","):
+        hasher = passwords.HASHERS[hasher_name](cost)
+        password_hash = hasher.hash("benchmark password")
+        started = time.perf_counter()
+        # As many concurrent checks as a worker lets hash at once
+        with ThreadPoolExecutor(max_workers=passwords.PASSWORD_HASH_THREADS) as executor:
+            list(executor.map(lambda _: passwords.check(password_hash, "benchmark password"), range(logins)))
+        elapsed = time.perf_counter() - started
+        print(f"{hasher.method}: {logins / elapsed:.1f} logins/s per worker with {passwords.PASSWORD_HASH_THREADS} hashing threads")
+
+def exact_similar_readers(books_by_reader, followed, id_reader, limit):
+    books = books_by_reader[id_reader]
+    scores = (
+        (len(books & other_books) / len(books | other_books), other_reader)
+        for other_reader, other_books in books_by_reader.items()
+        if other_reader != id_reader and other_reader not in followed
+    )
+    return [other_reader for similarity, other_reader in heapq.nlargest(limit, scores) if similarity > 0]
+
+@click.command("benchmark-similar-readers")
+@click.option("--samples", default=100, show_default=True, help="Readers looked up.")
+@click.option("--limit", default=10, show_default=True, help="Similar readers asked for.")
+@click.option("--seed", default=42, show_default=True)
+@with_appcontext
+def benchmark_similar_readers(samples, limit, seed):
+    """Recall and latency of the LSH lookup against an exact Jaccard scan over every reader."""
+    books_by_reader = similar_readers.read_book_sets()
+    following = {}
+    for id_follower, id_followed in db.session.query(follower.c.id_follower, follower.c.id_followed):
+        following.setdefault(id_follower, set()).add(id_followed)
+    readers = random.Random(seed).sample(sorted(books_by_reader), min(samples, len(books_by_reader)))
+    lsh_latencies, exact_latencies, recalls = [], [], []
+    for id_reader in readers:
+        started = time.perf_counter()
+        found = [other_reader for _, other_reader in similar_readers.similar_reader_ids(id_reader, limit)]
+        lsh_latencies.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        expected = exact_similar_readers(books_by_reader, following.get(id_reader, set()), id_reader, limit)
+        exact_latencies.append((time.perf_counter() - started) * 1000)
+        if expected:
+            recalls.append(len(set(found) & set(expected)) / len(expected))
+    print(f"{len(readers)} readers, top {limit}")
+    print(f"LSH:   p50 {percentile(lsh_latencies, 0.5):.2f} ms, p99 {percentile(lsh_latencies, 0.99):.2f} ms")
+    print(f"Exact: p50 {percentile(exact_latencies, 0.5):.2f} ms, p99 {percentile(exact_latencies, 0.99):.2f} ms (book sets already in memory)")
+    print(f"Recall: {sum(recalls) / len(recalls) if recalls else 0:.3f}")
+
+def orm_serialize(model):
+    """What the list routes did before column rows: load ORM instances, serialize() each one and encode with Flask's encoder."""
+    db.session.expunge_all()
+    return flask_json.dumps([instance.serialize() for instance in model.query.all()])
+
+def row_serialize(model):
+    return dumps(read_rows(db.session.query(*schema_columns(model))))
+
+@click.command("benchmark-serialization")
+@click.option("--repeat", default=10, show_default=True, help="Runs timed per model and path.")
+@with_appcontext
+def benchmark_serialization(repeat):
+    """Rows/s of listing every row of each model to JSON, from ORM instances against schema column rows encoded by utils.dumps (orjson when installed), on the current database."""
+    for model in (Reader, Author, Book, Review):
+        rows = model.query.count()
+        if not rows:
+            continue
+        orm_latencies, _ = time_calls(lambda: orm_serialize(model), repeat)
+        row_latencies, _ = time_calls(lambda: row_serialize(model), repeat)
+        print(f"{model.__tablename__} ({rows} rows)")
+        print(f"  ORM instances: {rows / percentile(orm_latencies, 0.5) * 1000:.0f} rows/s")
+        print(f"  Column rows:   {rows / percentile(row_latencies, 0.5) * 1000:.0f} rows/s")
+
+def like_search(term):
+    """The LIKE '%term%' lookups /books?title= and /authors?name= ran before the search module."""
+    pattern = f"%{term}%"
+    books = read_rows(db.session.query(*schema_columns(Book)).filter(Book.title.like(pattern)))
+    authors = read_rows(db.session.query(*schema_columns(Author)).filter(Author.name.like(pattern)))
+    return books + authors
+
+def full_text_search(term, limit):
+    return search.search_books(term, limit) + search.search_authors(term, limit)
+
+@click.command("benchmark-search")
+@click.option("--queries", default="sombra,historia,imp,noche del,garcía", show_default=True, help="Comma separated search terms.")
+@click.option("--repeat", default=20, show_default=True, help="Runs timed per term and path.")
+@click.option("--limit", default=MAX_PAGE_SIZE, show_default=True, help="Results asked from the search.")
+@with_appcontext
+def benchmark_search(queries, repeat, limit):
+    """Latency of the full-text search against the LIKE scans it replaced, on the current database."""
+    if not search.use_postgres():
+        search.invalidate()
+        started = time.perf_counter()
+        search.get_index("books", search.build_book_index)
+        search.get_index("authors", search.build_author_index)
+        print(f"In-process index built in {(time.perf_counter() - started) * 1000:.1f} ms (once per worker and SEARCH_INDEX_TTL)")
+    for term in queries.split(","):
+        like_latencies, like_results = time_calls(lambda: like_search(term), repeat)
+        search_latencies, search_results = time_calls(lambda: full_text_search(term, limit), repeat)
+        print(f"{term!r}")
+        print(f"  LIKE:   p50 {percentile(like_latencies, 0.5):.2f} ms, p99 {percentile(like_latencies, 0.99):.2f} ms, {len(like_results)} results")
+        print(f"  Search: p50 {percentile(search_latencies, 0.5):.2f} ms, p99 {percentile(search_latencies, 0.99):.2f} ms, {len(search_results)} results")
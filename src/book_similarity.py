@@ -0,0 +1,72 @@
+"""
+Builds book_similarity, the item-to-item neighbours behind recommendations.py.
+
+Every reader becomes a sparse vector of book weights (the strongest shelf the
+book is on, moved up or down by the reader's review stars), stacked into a
+readers x books SciPy CSR matrix. With its columns normalized, Xᵀ·X holds the
+cosine similarity of every pair of books that share a reader. It is computed
+one block of books at a time, and the top K neighbours of each book are
+stored. Only `flask build-recommendations` imports this module, so the web
+workers never load NumPy or SciPy.
+"""
+import numpy as np
+from scipy import sparse
+
+from models import db, BookSimilarity, Review, Shelf, STREAM_BATCH_SIZE
+from recommendations import SHELF_WEIGHTS, REVIEW_BASE_WEIGHT, STARS_ADJUSTMENT
+
+# Books whose similarity rows are computed together, which bounds the memory of each product
+BLOCK_SIZE = 1000
+INSERT_BATCH_SIZE = 1000
+
+def reader_matrix():
+    """Returns the readers x books CSR matrix of weights and the book id of each column."""
+    weights = {}
+    for id_reader, id_book, shelf_name in db.session.query(Shelf.id_reader, Shelf.id_book, Shelf.shelf_name).yield_per(STREAM_BATCH_SIZE):
+        weights[id_reader, id_book] = max(weights.get((id_reader, id_book), 0), SHELF_WEIGHTS.get(shelf_name, 1))
+    stars_by_pair = {(id_reader, id_book): stars for id_reader, id_book, stars in db.session.query(Review.id_reader, Review.id_book, Review.stars).yield_per(STREAM_BATCH_SIZE)}
+    for pair, stars in stars_by_pair.items():
+        weights[pair] = weights.get(pair, REVIEW_BASE_WEIGHT) + STARS_ADJUSTMENT[stars]
+    pairs = [(pair, weight) for pair, weight in weights.items() if weight > 0]
+    reader_ids = np.array([id_reader for (id_reader, _), _ in pairs], dtype=np.int64)
+    book_ids = np.array([id_book for (_, id_book), _ in pairs], dtype=np.int64)
+    values = np.array([weight for _, weight in pairs], dtype=np.float64)
+    readers, rows = np.unique(reader_ids, return_inverse=True)
+    books, columns = np.unique(book_ids, return_inverse=True)
+    return sparse.csr_matrix((values, (rows, columns)), shape=(len(readers), len(books))), books
+
+def top_neighbours(columns, scores, top_k):
+    if len(scores) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        columns, scores = columns[best], scores[best]
+    order = np.lexsort((-columns, -scores))
+    return columns[order], scores[order]
+
+def nearest_neighbours(matrix, book_ids, top_k):
+    """Yields (id_book, [(score, id_similar), ...]) with the top_k most similar books by cosine."""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = sparse.csc_matrix(matrix.multiply(1 / norms))
+    transposed = normalized.T.tocsr()
+    for start in range(0, len(book_ids), BLOCK_SIZE):
+        similarities = (transposed[start:start + BLOCK_SIZE] @ normalized).tocsr()
+        for row in range(similarities.shape[0]):
+            low, high = similarities.indptr[row], similarities.indptr[row + 1]
+            columns, scores = similarities.indices[low:high], similarities.data[low:high]
+            # Every book is its own closest neighbour
+            others = columns != start + row
+            columns, scores = top_neighbours(columns[others], scores[others], top_k)
+            if len(columns):
+                yield int(book_ids[start + row]), [(float(score), int(book_ids[column])) for column, score in zip(columns, scores)]
+
+def build(top_k):
+    table = BookSimilarity.__table__
+    rows = [
+        {"id_book": id_book, "id_similar": id_similar, "score": round(score, 6)}
+        for id_book, neighbours in nearest_neighbours(*reader_matrix(), top_k)
+        for score, id_similar in neighbours
+    ]
+    db.session.execute(table.delete())
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,167 @@
+"""
+Response cache for the read-heavy catalog endpoints.
+
+Responses are kept in an in-process LRU with a TTL, or in Redis when
+CACHE_REDIS_URL is set. On routes that also use conditional_get, entries are
+keyed on the table versions behind the ETag, so a write committed by any
+worker makes them unreachable. A worker also drops its entries when one of its
+own transactions that wrote to a cached table commits.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, request, make_response, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import UpdateBase
+
+from models import Book, Author, BookRating, written_by
+from utils import get_stream_format
+
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 60))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 256))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+
+class LRUCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        # An entry can ask for a shorter life than the cache default, never a longer one
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class RedisCache:
+    """Shared by every worker. Clearing bumps a generation number instead of deleting keys; old entries expire on their own."""
+    GENERATION_KEY = "response_cache:generation"
+
+    def __init__(self, url, ttl):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def key(self, key):
+        generation = int(self.client.get(self.GENERATION_KEY) or 0)
+        return f"response_cache:{generation}:{key}"
+
+    def get(self, key):
+        value = self.client.get(self.key(key))
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.key(key), pickle.dumps(value), ex=self.ttl)
+
+    def clear(self):
+        self.client.incr(self.GENERATION_KEY)
+
+def create_backend():
+    if CACHE_REDIS_URL:
+        return RedisCache(CACHE_REDIS_URL, CACHE_TTL)
+    return LRUCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+
+backend = create_backend()
+stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def cache_key():
+    # Under conditional_get the key includes the table versions the response was built from, so a worker
+    # never serves a body cached before another worker's write
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return f"{request.path}?{args}|{g.get('version_etag', '')}"
+
+def cached_response(view):
+    @wraps(view)
+    def decorator(*args, **kwargs):
+        # Streamed exports are never buffered into the cache
+        if get_stream_format(request):
+            return view(*args, **kwargs)
+
+        key = cache_key()
+        cached = backend.get(key)
+        if cached is not None:
+            stats["hits"] += 1
+            body, status, mimetype, etag = cached
+            response = Response(body, status=status, mimetype=mimetype)
+            response.set_etag(etag)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        stats["misses"] += 1
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            body = response.get_data()
+            etag = hashlib.md5(body).hexdigest()
+            backend.set(key, (body, response.status_code, response.mimetype, etag))
+            response.set_etag(etag)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    return decorator
+
+def clear():
+    stats["invalidations"] += 1
+    backend.clear()
+
+# Writes only mark the cache as stale, and this worker's entries are cleared once the transaction commits.
+# This does not make the cache consistent: a request that read rows before the commit can still store them
+# afterwards, and other workers keep their entries. Freshness comes from cache_key including the table
+# versions on conditional_get routes; clearing just frees entries that can no longer be hit.
+_pending = threading.local()
+
+def mark_stale(*args):
+    _pending.stale = True
+
+def clear_if_stale(session):
+    if getattr(_pending, "stale", False):
+        _pending.stale = False
+        clear()
+
+def forget_stale(session):
+    _pending.stale = False
+
+def mark_stale_on_table_write(conn, clauseelement, multiparams, params, *args):
+    # Catches Core statements that mapper events never see: written_by links and the bulk rating counter updates
+    if isinstance(clauseelement, UpdateBase) and clauseelement.table in CACHED_TABLES:
+        mark_stale()
+
+CACHED_TABLES = (written_by, BookRating.__table__)
+
+for model in (Book, Author, BookRating):
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, event_name, mark_stale)
+event.listen(Engine, "after_execute", mark_stale_on_table_write)
+event.listen(Session, "after_commit", clear_if_stale)
+event.listen(Session, "after_rollback", forget_stale)
@@ -0,0 +1,111 @@
+"""
+Conditional GET support.
+
+Writes to a versioned table are noted on their connection, and once the
+transaction commits each written table's row in table_version is bumped in a
+short transaction of its own. The version row is therefore locked only for
+that UPDATE, not for the whole writing transaction, so concurrent writers
+don't queue on it. A route decorated with conditional_get derives its ETag and
+Last-Modified from the versions of the tables it reads, so an unchanged
+collection is answered with 304 before it is queried or serialized.
+"""
+import datetime
+import hashlib
+import threading
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, request, make_response, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import UpdateBase
+
+from models import db, TableVersion, insert_ignoring_duplicates
+from utils import get_stream_format
+
+VERSIONED_TABLES = ("book", "author", "written_by", "review", "shelf", "reader")
+
+version_table = TableVersion.__table__
+
+# Tables written by this thread's transactions that have committed and are not bumped yet
+_committed = threading.local()
+
+def note_write(conn, clauseelement, multiparams, params, *args):
+    if isinstance(clauseelement, UpdateBase):
+        mark_written(conn, clauseelement.table.name)
+
+def mark_written(conn, table_name):
+    """Also called directly by writes that bypass the Engine, such as COPY."""
+    if table_name in VERSIONED_TABLES:
+        conn.info.setdefault("written_tables", set()).add(table_name)
+
+def collect_written_tables(conn):
+    # Runs just before the commit; a savepoint rolled back on the way only costs an extra bump
+    written = conn.info.pop("written_tables", None)
+    if written:
+        _committed.tables = getattr(_committed, "tables", set()) | written
+
+def forget_written_tables(conn):
+    conn.info.pop("written_tables", None)
+
+def bump_table_version(conn, table_name):
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    updated = conn.execute(version_table.update().where(version_table.c.table_name == table_name).values(version=version_table.c.version + 1, updated_at=now))
+    if not updated.rowcount:
+        # Rows are seeded by the migration; only a database made with create_all lacks them
+        conn.execute(insert_ignoring_duplicates(version_table).values(table_name=table_name, version=1, updated_at=now))
+
+def bump_committed_versions(*args):
+    """Bumps the tables written by the transactions that just committed. Core transactions outside a Session call it themselves after commit."""
+    tables = getattr(_committed, "tables", None)
+    if not tables:
+        return
+    _committed.tables = set()
+    # Sorted, so two bumps of the same tables lock their rows in the same order
+    with db.engine.begin() as conn:
+        for table_name in sorted(tables):
+            bump_table_version(conn, table_name)
+
+def read_etag(table_names):
+    versions = TableVersion.read_versions(table_names)
+    stamp = "|".join(f"{name}:{versions.get(name, (0, None))[0]}" for name in table_names)
+    args = urlencode(sorted(request.args.items(multi=True)))
+    key = f"{request.path}?{args}|{get_stream_format(request)}|{stamp}"
+    updated_at = [updated_at for version, updated_at in versions.values() if updated_at is not None]
+    return hashlib.md5(key.encode("utf-8")).hexdigest(), max(updated_at) if updated_at else None
+
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def conditional_get(*table_names):
+    """Answers GET requests with 304 when none of table_names changed since the client's copy."""
+    def wrapper(view):
+        @wraps(view)
+        def decorator(*args, **kwargs):
+            etag, last_modified = read_etag(table_names)
+            # cache.cached_response keys its entries on this, so a cached body always matches its versions
+            g.version_etag = etag
+            if is_not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+
+        return decorator
+
+    return wrapper
+
+event.listen(Engine, "after_execute", note_write)
+event.listen(Engine, "commit", collect_written_tables)
+event.listen(Engine, "rollback", forget_written_tables)
+event.listen(Session, "after_commit", bump_committed_versions)
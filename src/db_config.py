@@ -0,0 +1,40 @@
+"""
+Engine options read from the environment.
+
+The pool defaults to one connection per gunicorn thread (GUNICORN_THREADS), so
+a gthread worker never waits on the pool; override with DB_POOL_SIZE.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from gunicorn_config import threads
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+def engine_options(database_uri):
+    # SQLite uses its own single-file pools, which take none of these options
+    if not database_uri or database_uri.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", threads)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 5)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "true"),
+    }
+    statement_timeout = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout and database_uri.startswith("postgres"):
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+def set_mysql_statement_timeout(dbapi_connection, connection_record):
+    statement_timeout = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout and "mysql" in type(dbapi_connection).__module__.lower():
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION max_execution_time = {statement_timeout}")
+        cursor.close()
+
+event.listen(Pool, "connect", set_mysql_statement_timeout)
@@ -0,0 +1,151 @@
+"""
+Home feed: recent reviews and shelf entries of the readers someone follows.
+
+Every new Review or Shelf row is recorded as an activity and fanned out on
+write into the timeline of each follower, so reading a feed page is a range
+read on timeline_entry. Readers following more than
+FEED_FANOUT_MAX_FOLLOWING others get no timeline; their feed is merged from
+the activity of the readers they follow when it is read. Timelines are kept
+to about the newest FEED_TIMELINE_SIZE entries on write: a follow trims the
+follower's timeline, and one activity id in FEED_TRIM_EVERY trims the
+timelines it was fanned out to, so a timeline overshoots by about
+FEED_TRIM_EVERY entries at most between trims. `flask trim-timelines` trims
+every timeline exactly.
+"""
+import datetime
+import os
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, literal, null, select
+
+from models import db, Activity, Book, Reader, Review, Shelf, TimelineEntry, follower
+
+FEED_FANOUT_MAX_FOLLOWING = int(os.environ.get("FEED_FANOUT_MAX_FOLLOWING", 500))
+FEED_TIMELINE_SIZE = int(os.environ.get("FEED_TIMELINE_SIZE", 1000))
+FEED_TRIM_EVERY = int(os.environ.get("FEED_TRIM_EVERY", 100))
+
+activity_table = Activity.__table__
+timeline_table = TimelineEntry.__table__
+following = follower.alias("following")
+
+def following_count(id_reader):
+    return select([func.count()]).where(following.c.id_follower == id_reader)
+
+def fan_out(id_reader, id_activity):
+    """Followers of id_reader that keep a timeline, paired with the new activity."""
+    return select([follower.c.id_follower, literal(id_activity)]).where(follower.c.id_followed == id_reader).where(
+        following_count(follower.c.id_follower).as_scalar() <= FEED_FANOUT_MAX_FOLLOWING
+    )
+
+def trim_timeline(connection, id_owner, size=FEED_TIMELINE_SIZE):
+    # A select then a delete, since MySQL can't delete from a table it selects from in the same statement
+    oldest_kept = connection.execute(
+        select([timeline_table.c.id_activity]).where(timeline_table.c.id_owner == id_owner).order_by(timeline_table.c.id_activity.desc()).offset(size - 1).limit(1)
+    ).scalar()
+    if oldest_kept is not None:
+        connection.execute(timeline_table.delete().where(timeline_table.c.id_owner == id_owner).where(timeline_table.c.id_activity < oldest_kept))
+
+def trim_fans(connection, id_reader, first_activity, last_activity):
+    """Trims the timelines of id_reader's followers when the new activity ids include a multiple of FEED_TRIM_EVERY."""
+    if last_activity // FEED_TRIM_EVERY == (first_activity - 1) // FEED_TRIM_EVERY:
+        return
+    fans = connection.execute(select([follower.c.id_follower]).where(follower.c.id_followed == id_reader)).fetchall()
+    for (id_owner,) in fans:
+        trim_timeline(connection, id_owner)
+
+def record(connection, id_reader, kind, id_book, **details):
+    inserted = connection.execute(activity_table.insert().values(
+        id_reader=id_reader, kind=kind, id_book=id_book, created_at=datetime.datetime.utcnow(), **details
+    ))
+    id_activity = inserted.inserted_primary_key[0]
+    connection.execute(timeline_table.insert().from_select(["id_owner", "id_activity"], fan_out(id_reader, id_activity)))
+    trim_fans(connection, id_reader, id_activity, id_activity)
+
+def record_many(connection, id_reader, kind, entries):
+    """Records several activities of one reader with a single insert and a single fan-out."""
+    last_id = connection.execute(select([func.max(Activity.id)]).where(Activity.id_reader == id_reader)).scalar() or 0
+    now = datetime.datetime.utcnow()
+    connection.execute(activity_table.insert(), [dict(entry, id_reader=id_reader, kind=kind, created_at=now) for entry in entries])
+    fans = select([follower.c.id_follower, Activity.id]).select_from(
+        activity_table.join(follower, follower.c.id_followed == Activity.id_reader)
+    ).where(Activity.id_reader == id_reader).where(Activity.id > last_id).where(
+        following_count(follower.c.id_follower).as_scalar() <= FEED_FANOUT_MAX_FOLLOWING
+    )
+    connection.execute(timeline_table.insert().from_select(["id_owner", "id_activity"], fans))
+    first_activity, last_activity = connection.execute(
+        select([func.min(Activity.id), func.max(Activity.id)]).where(Activity.id_reader == id_reader).where(Activity.id > last_id)
+    ).first()
+    if first_activity is not None:
+        trim_fans(connection, id_reader, first_activity, last_activity)
+
+def record_review(mapper, connection, review):
+    record(connection, review.id_reader, "review", review.id_book, id_review=review.id)
+
+def record_shelf(mapper, connection, shelf):
+    record(connection, shelf.id_reader, "shelf", shelf.id_book, shelf_name=shelf.shelf_name)
+
+def follow(id_follower, id_followed):
+    """Copies the recent activity of a newly followed reader into the follower's timeline."""
+    recent = select([literal(id_follower), Activity.id]).where(Activity.id_reader == id_followed).order_by(Activity.id.desc()).limit(FEED_TIMELINE_SIZE)
+    db.session.execute(timeline_table.insert().from_select(["id_owner", "id_activity"], recent))
+    trim_timeline(db.session, id_follower)
+
+def unfollow(id_follower, id_followed):
+    activities = select([Activity.id]).where(Activity.id_reader == id_followed)
+    db.session.execute(timeline_table.delete().where(timeline_table.c.id_owner == id_follower).where(timeline_table.c.id_activity.in_(activities)))
+
+def read_feed(id_reader, limit, after=None):
+    """Newest first; after is the id of the last activity of the previous page."""
+    feed = db.session.query(
+        Activity.id, Activity.kind, Activity.id_reader, Reader.username, Activity.id_book, Book.title,
+        Activity.shelf_name, Review.stars, Review.review, Activity.created_at
+    ).join(Reader, Reader.id == Activity.id_reader).join(Book, Book.id == Activity.id_book).outerjoin(Review, Review.id == Activity.id_review)
+    if db.session.execute(following_count(id_reader)).scalar() > FEED_FANOUT_MAX_FOLLOWING:
+        followed = select([follower.c.id_followed]).where(follower.c.id_follower == id_reader)
+        feed = feed.filter(Activity.id_reader.in_(followed)).order_by(Activity.id.desc())
+    else:
+        feed = feed.join(TimelineEntry, TimelineEntry.id_activity == Activity.id).filter(TimelineEntry.id_owner == id_reader).order_by(TimelineEntry.id_activity.desc())
+    if after is not None:
+        feed = feed.filter(Activity.id < after)
+    items = []
+    for row in feed.limit(limit):
+        item = row._asdict()
+        item["created_at"] = item["created_at"].isoformat()
+        items.append(item)
+    return items
+
+def trim_timelines(size=FEED_TIMELINE_SIZE):
+    owners = db.session.query(TimelineEntry.id_owner).group_by(TimelineEntry.id_owner).having(func.count() > size).all()
+    for (id_owner,) in owners:
+        trim_timeline(db.session, id_owner, size)
+    db.session.commit()
+    return len(owners)
+
+def rebuild():
+    """Recreates activities and timelines from the review and shelf tables, for rows loaded without the ORM."""
+    now = datetime.datetime.utcnow()
+    db.session.execute(timeline_table.delete())
+    db.session.execute(activity_table.delete())
+    columns = ["id_reader", "kind", "id_book", "id_review", "shelf_name", "created_at"]
+    db.session.execute(activity_table.insert().from_select(columns, select([
+        Review.id_reader, literal("review"), Review.id_book, Review.id, null(), literal(now)
+    ]).order_by(Review.id)))
+    db.session.execute(activity_table.insert().from_select(columns, select([
+        Shelf.id_reader, literal("shelf"), Shelf.id_book, null(), Shelf.shelf_name, literal(now)
+    ])))
+    fans = select([follower.c.id_follower, Activity.id]).select_from(
+        activity_table.join(follower, follower.c.id_followed == Activity.id_reader)
+    ).where(following_count(follower.c.id_follower).as_scalar() <= FEED_FANOUT_MAX_FOLLOWING)
+    db.session.execute(timeline_table.insert().from_select(["id_owner", "id_activity"], fans))
+    db.session.commit()
+    trim_timelines()
+
+@click.command("trim-timelines")
+@click.option("--size", default=FEED_TIMELINE_SIZE, show_default=True, help="Entries kept per reader.")
+@with_appcontext
+def trim_timelines_command(size):
+    print(f"Trimmed {trim_timelines(size)} timelines")
+
+event.listen(Review, "after_insert", record_review)
+event.listen(Shelf, "after_insert", record_shelf)
@@ -0,0 +1,210 @@
+"""
+In-process follow graph.
+
+The follower table is loaded into compressed sparse row arrays, in both
+directions, so neighbour lists, follow checks and counts are array slices
+and binary searches. Follows and unfollows made through this module go to
+the table and to a small overlay on top of the arrays. The arrays are
+recompacted once the overlay holds COMPACT_AFTER changes. Each worker keeps
+its own graph and reloads it after FOLLOW_GRAPH_TTL seconds, so changes made
+by other workers show up within that time.
+"""
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+from itertools import accumulate
+
+from sqlalchemy import and_
+
+import feed
+from models import db, Reader, follower, insert_ignoring_duplicates
+from utils import APIException
+
+FOLLOW_GRAPH_TTL = int(os.environ.get("FOLLOW_GRAPH_TTL", 60))
+COMPACT_AFTER = 1000
+
+def build_csr(edges, size):
+    """edges are (source, target) pairs sorted by source then target."""
+    counts = [0] * (size + 1)
+    for source, _ in edges:
+        counts[source + 1] += 1
+    return array("l", accumulate(counts)), array("l", (target for _, target in edges))
+
+class FollowGraph:
+    def __init__(self, edges):
+        edges = sorted(set(edges))
+        self.size = max((max(edge) for edge in edges), default=0) + 1
+        self.following_offsets, self.following_targets = build_csr(edges, self.size)
+        self.followers_offsets, self.followers_targets = build_csr(sorted((followed, id_follower) for id_follower, followed in edges), self.size)
+        # Changes since the arrays were built, by reader
+        self.added_following = defaultdict(set)
+        self.added_followers = defaultdict(set)
+        self.removed_following = defaultdict(set)
+        self.removed_followers = defaultdict(set)
+        self.changes = 0
+
+    def base_range(self, offsets, id_reader):
+        if not 0 <= id_reader < self.size:
+            return 0, 0
+        return offsets[id_reader], offsets[id_reader + 1]
+
+    def neighbours(self, offsets, targets, added, removed, id_reader):
+        low, high = self.base_range(offsets, id_reader)
+        gone = removed.get(id_reader)
+        result = [target for target in targets[low:high] if not gone or target not in gone]
+        result.extend(added.get(id_reader, ()))
+        return result
+
+    def following(self, id_reader):
+        return self.neighbours(self.following_offsets, self.following_targets, self.added_following, self.removed_following, id_reader)
+
+    def followers(self, id_reader):
+        return self.neighbours(self.followers_offsets, self.followers_targets, self.added_followers, self.removed_followers, id_reader)
+
+    def count(self, offsets, added, removed, id_reader):
+        low, high = self.base_range(offsets, id_reader)
+        return high - low + len(added.get(id_reader, ())) - len(removed.get(id_reader, ()))
+
+    def following_count(self, id_reader):
+        return self.count(self.following_offsets, self.added_following, self.removed_following, id_reader)
+
+    def follower_count(self, id_reader):
+        return self.count(self.followers_offsets, self.added_followers, self.removed_followers, id_reader)
+
+    def follows(self, id_follower, id_followed):
+        if id_followed in self.added_following.get(id_follower, ()):
+            return True
+        if id_followed in self.removed_following.get(id_follower, ()):
+            return False
+        low, high = self.base_range(self.following_offsets, id_follower)
+        position = bisect_left(self.following_targets, id_followed, low, high)
+        return position < high and self.following_targets[position] == id_followed
+
+    def add(self, id_follower, id_followed):
+        if self.follows(id_follower, id_followed):
+            return
+        if id_followed in self.removed_following.get(id_follower, ()):
+            self.removed_following[id_follower].discard(id_followed)
+            self.removed_followers[id_followed].discard(id_follower)
+        else:
+            self.added_following[id_follower].add(id_followed)
+            self.added_followers[id_followed].add(id_follower)
+        self.changed()
+
+    def remove(self, id_follower, id_followed):
+        if not self.follows(id_follower, id_followed):
+            return
+        if id_followed in self.added_following.get(id_follower, ()):
+            self.added_following[id_follower].discard(id_followed)
+            self.added_followers[id_followed].discard(id_follower)
+        else:
+            self.removed_following[id_follower].add(id_followed)
+            self.removed_followers[id_followed].add(id_follower)
+        self.changed()
+
+    def changed(self):
+        self.changes += 1
+        if self.changes >= COMPACT_AFTER:
+            self.__init__(self.edges())
+
+    def edges(self):
+        readers = set(range(self.size)) | set(self.added_following)
+        return [(id_follower, id_followed) for id_follower in readers for id_followed in self.following(id_follower)]
+
+    def suggestions(self, id_reader, limit):
+        """Readers followed by the readers id_reader follows, ranked by how many of them do; ties go to the most followed."""
+        following = set(self.following(id_reader))
+        mutual_counts = defaultdict(int)
+        for id_followed in following:
+            for candidate in self.following(id_followed):
+                if candidate != id_reader and candidate not in following:
+                    mutual_counts[candidate] += 1
+        return nlargest(limit, mutual_counts.items(), key=lambda item: (item[1], self.follower_count(item[0]), -item[0]))
+
+_lock = threading.Lock()
+_graph = None
+_built_at = 0
+# Changes made while a stale graph is reloaded, replayed on the new one since its load may have missed them
+_reloading = False
+_pending = []
+
+def load_graph():
+    return FollowGraph(db.session.query(follower.c.id_follower, follower.c.id_followed).all())
+
+def graph():
+    """Returns the worker's graph; read or change it with _lock held. A stale graph is reloaded without holding _lock, and the old one is served meanwhile."""
+    global _graph, _built_at, _reloading
+    with _lock:
+        if _graph is None:
+            _graph = load_graph()
+            _built_at = time.time()
+        if _reloading or time.time() - _built_at <= FOLLOW_GRAPH_TTL:
+            return _graph
+        _reloading = True
+        _pending.clear()
+    try:
+        follow_graph = load_graph()
+    except Exception:
+        with _lock:
+            _reloading = False
+        raise
+    with _lock:
+        for change in _pending:
+            change(follow_graph)
+        _pending.clear()
+        _graph, _built_at, _reloading = follow_graph, time.time(), False
+        return _graph
+
+def change_graph(change):
+    graph()
+    with _lock:
+        change(_graph)
+        if _reloading:
+            _pending.append(change)
+
+def follow(id_follower, id_followed):
+    """Returns False when id_follower already followed id_followed."""
+    if db.session.query(Reader.id).filter_by(id=id_followed).scalar() is None:
+        raise APIException("Reader not found", status_code=404)
+    # A concurrent follow of the same reader is skipped by the insert instead of failing on the primary key
+    inserted = db.session.execute(insert_ignoring_duplicates(follower).values(id_follower=id_follower, id_followed=id_followed))
+    created = bool(inserted.rowcount)
+    if created:
+        feed.follow(id_follower, id_followed)
+    db.session.commit()
+    change_graph(lambda follow_graph: follow_graph.add(id_follower, id_followed))
+    return created
+
+def unfollow(id_follower, id_followed):
+    """Returns False when id_follower did not follow id_followed."""
+    deleted = db.session.execute(follower.delete().where(and_(follower.c.id_follower == id_follower, follower.c.id_followed == id_followed)))
+    if deleted.rowcount:
+        feed.unfollow(id_follower, id_followed)
+    db.session.commit()
+    change_graph(lambda follow_graph: follow_graph.remove(id_follower, id_followed))
+    return bool(deleted.rowcount)
+
+def relationship(id_reader, id_other):
+    follow_graph = graph()
+    with _lock:
+        follows = follow_graph.follows(id_reader, id_other)
+        followed_by = follow_graph.follows(id_other, id_reader)
+    return {"follows": follows, "followed_by": followed_by, "mutual": follows and followed_by}
+
+def follow_counts(id_reader):
+    follow_graph = graph()
+    with _lock:
+        return {"followers": follow_graph.follower_count(id_reader), "following": follow_graph.following_count(id_reader)}
+
+def suggestions(id_reader, limit):
+    follow_graph = graph()
+    with _lock:
+        mutual_counts = dict(follow_graph.suggestions(id_reader, limit))
+    readers = Reader.read_by_ids(list(mutual_counts), Reader.public_schema)
+    for reader in readers:
+        reader["mutual_count"] = mutual_counts[reader["id"]]
+    return readers
@@ -0,0 +1,142 @@
+"""
+Deterministic synthetic dataset for load testing.
+
+Follows and reader activity are skewed the way real catalogs are: a few
+readers collect most followers and a few books get most reviews and shelf
+entries (Zipf-distributed picks). Run it against an empty database.
+"""
+import random
+from itertools import accumulate
+
+import click
+from flask.cli import with_appcontext
+
+from models import Book, BookRating, Shelf
+import feed
+import similar_readers
+from init_database import load_seed_data_bulk
+
+WORDS = [
+    "sombra", "viento", "corazón", "reino", "noche", "historia", "camino", "ciudad", "guerra", "amor",
+    "secreto", "memoria", "fuego", "río", "luna", "jardín", "invierno", "verano", "isla", "espejo",
+    "último", "perdido", "silencio", "imperio", "dragón", "héroe", "bruma", "ascensión", "leyenda", "tiempo",
+    "mar", "montaña", "sueño", "promesa", "destino", "canción", "carta", "viaje", "estrella", "orgullo",
+]
+FIRST_NAMES = ["Lucía", "Martín", "Sofía", "Hugo", "Valentina", "Mateo", "Julia", "Álvaro", "Elena", "Íñigo", "Carmen", "Raúl"]
+LAST_NAMES = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Fernández", "Díaz", "Muñoz", "Álvarez", "Romero", "Núñez"]
+STARS = ["1", "2", "3", "4", "5"]
+STARS_CUM_WEIGHTS = list(accumulate([5, 8, 20, 35, 32]))
+
+def zipf_cum_weights(size, alpha=1.1):
+    # Cumulative, so each draw is a binary search instead of summing every weight again
+    return list(accumulate(1 / (rank ** alpha) for rank in range(1, size + 1)))
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def unique_pairs(rng, count, pick):
+    """Draws up to count distinct tuples from pick(); gives up on collisions once the space is nearly full."""
+    pairs = set()
+    attempts = 0
+    while len(pairs) < count and attempts < count * 10:
+        attempts += 1
+        pair = pick()
+        if pair is not None:
+            pairs.add(pair)
+    return sorted(pairs)
+
+def generate(readers=1000, authors=200, books=5000, reviews=20000, shelf_entries=20000, follows=10000, seed=42):
+    rng = random.Random(seed)
+    reader_ids = list(range(1, readers + 1))
+    author_ids = list(range(1, authors + 1))
+    book_ids = list(range(1, books + 1))
+    # Popular readers and books are spread over the id range instead of being the lowest ids
+    popular_readers = rng.sample(reader_ids, len(reader_ids))
+    popular_books = rng.sample(book_ids, len(book_ids))
+    popular_authors = rng.sample(author_ids, len(author_ids))
+    reader_weights = zipf_cum_weights(readers)
+    book_weights = zipf_cum_weights(books)
+    author_weights = zipf_cum_weights(authors)
+
+    def popular_reader():
+        return rng.choices(popular_readers, cum_weights=reader_weights)[0]
+
+    def popular_book():
+        return rng.choices(popular_books, cum_weights=book_weights)[0]
+
+    formats = Book.__table__.c.format_type.type.enums
+    genres = Book.__table__.c.genre.type.enums
+    shelf_names = Shelf.__table__.c.shelf_name.type.enums
+
+    data = {}
+    data["Reader"] = [{
+        "id": id_reader,
+        "is_active": True,
+        "username": f"lector{id_reader}",
+        "email": f"lector{id_reader}@example.com",
+        "password": "123456",
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "description": words(rng, 12),
+    } for id_reader in reader_ids]
+    data["Author"] = [{
+        "id": id_author,
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {id_author}",
+        "biography": words(rng, 40),
+        "image": None,
+    } for id_author in author_ids]
+    data["Book"] = [{
+        "id": id_book,
+        "image": None,
+        "title": words(rng, rng.randint(2, 5)).capitalize(),
+        "synopsis": words(rng, rng.randint(40, 120)),
+        "format_type": rng.choice(formats),
+        "genre": rng.choice(genres),
+        "price": round(rng.uniform(5, 35), 2),
+    } for id_book in book_ids]
+
+    written = set()
+    for id_book in book_ids:
+        for id_author in rng.choices(popular_authors, cum_weights=author_weights, k=2 if rng.random() < 0.1 else 1):
+            written.add((id_author, id_book))
+    data["written_by"] = [{"id_author": id_author, "id_book": id_book} for id_author, id_book in sorted(written)]
+
+    def follow_edge():
+        id_follower, id_followed = rng.choice(reader_ids), popular_reader()
+        return (id_follower, id_followed) if id_follower != id_followed else None
+
+    data["follower"] = [
+        {"id_follower": id_follower, "id_followed": id_followed}
+        for id_follower, id_followed in unique_pairs(rng, follows, follow_edge)
+    ]
+    data["Shelf"] = [
+        {"id_reader": id_reader, "id_book": id_book, "shelf_name": shelf_name}
+        for id_reader, id_book, shelf_name in unique_pairs(rng, shelf_entries, lambda: (rng.choice(reader_ids), popular_book(), rng.choice(shelf_names)))
+    ]
+    data["Review"] = [{
+        "id": id_review,
+        "id_reader": rng.choice(reader_ids),
+        "id_book": popular_book(),
+        "stars": rng.choices(STARS, cum_weights=STARS_CUM_WEIGHTS)[0],
+        "review": words(rng, rng.randint(10, 60)),
+    } for id_review in range(1, reviews + 1)]
+    return data
+
+def load_generated_data(readers, authors, books, reviews, shelf_entries, follows, seed=42, batch_size=1000):
+    load_seed_data_bulk(generate(readers, authors, books, reviews, shelf_entries, follows, seed), batch_size)
+    # Reviews and shelves are bulk inserted, so the rating aggregates, feeds and reader signatures are computed afterwards
+    BookRating.rebuild()
+    feed.rebuild()
+    similar_readers.rebuild()
+
+@click.command("generate-data")
+@click.option("--readers", default=1000, show_default=True)
+@click.option("--authors", default=200, show_default=True)
+@click.option("--books", default=5000, show_default=True)
+@click.option("--reviews", default=20000, show_default=True)
+@click.option("--shelf-entries", default=20000, show_default=True)
+@click.option("--follows", default=10000, show_default=True)
+@click.option("--seed", default=42, show_default=True, help="Same seed, same dataset.")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def generate_data(readers, authors, books, reviews, shelf_entries, follows, seed, batch_size):
+    load_generated_data(readers, authors, books, reviews, shelf_entries, follows, seed, batch_size)
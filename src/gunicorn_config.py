@@ -0,0 +1,20 @@
+# Gunicorn settings, used by the Procfile: gunicorn -c src/gunicorn_config.py wsgi --chdir ./src/
+# Read more about them here: https://docs.gunicorn.org/en/stable/settings.html
+import multiprocessing
+import os
+
+# Threads share one process, so most of the request time spent waiting on the
+# database overlaps instead of blocking a whole sync worker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+# Import the app once in the master so workers share its memory pages
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+def post_fork(server, worker):
+    # Connections opened by the master while preloading must not be shared between workers
+    from main import app, db
+    with app.app_context():
+        db.engine.dispose()
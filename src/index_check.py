@@ -0,0 +1,120 @@
+"""
+Query plan check for the model read methods.
+
+`flask check-indexes` calls every filtered read method with ids taken from
+the database, EXPLAINs each statement it sends and fails when a plan reads a
+table without an index (SCAN on SQLite, Seq Scan on Postgres, type ALL on
+MySQL). Each call is also held to a query budget, so an N+1 coming back
+fails the same way. Full-table listings and exports are left out, since
+reading everything is what they are for.
+"""
+import re
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event
+
+from models import db, Author, Book, Reader, Review, Shelf, TableVersion
+from utils import assert_max_queries
+from generate_data import load_generated_data
+from benchmark import sample_arguments
+import feed
+import recommendations
+import similar_readers
+
+# Rows per table seeded into an empty database; enough for every planner to prefer an index when it has one
+SEED_SIZES = {"readers": 500, "authors": 100, "books": 2000, "reviews": 5000, "shelf_entries": 5000, "follows": 3000}
+
+SQLITE_SCAN = re.compile(r"SCAN (?:TABLE )?(\w+)")
+SQLITE_DERIVED = re.compile(r"(?:MATERIALIZE|CO-ROUTINE) (\w+)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+def read_checks(arguments):
+    """(name, query budget, call) for every read method that looks rows up by a key."""
+    id_reader, id_book, reader_id, shelf_name = arguments["id_reader"], arguments["id_book"], arguments["reader_id"], arguments["shelf_name"]
+    return [
+        ("Review.read_page", 1, lambda: Review.read_page(20, after=id_book)),
+        ("Review.read_page_by_book", 1, lambda: Review.read_page_by_book(id_book, 20)),
+        ("Shelf.read_by_reader_and_name", 1, lambda: Shelf.read_by_reader_and_name(shelf_name, reader_id)),
+        ("Shelf.read_books_by_reader_and_name", 1, lambda: Shelf.read_books_by_reader_and_name(shelf_name, reader_id)),
+        ("Reader.read_by_ids", 1, lambda: Reader.read_by_ids([id_reader, reader_id])),
+        ("Reader.read_followers", 1, lambda: Reader.read_followers(id_reader, 20)),
+        ("Reader.read_following", 1, lambda: Reader.read_following(reader_id, 20)),
+        ("Reader.read_page", 1, lambda: Reader.read_page(20, after=id_reader)),
+        ("Book.read_by_ids", 1, lambda: Book.read_by_ids([id_book])),
+        ("Book.read_page_with_authors", 1, lambda: Book.read_page_with_authors(20, after=id_book)),
+        ("Author.read", 1, lambda: Author.read(arguments["name_input"])),
+        ("Author.read_by_ids", 1, lambda: Author.read_by_ids([1, 2])),
+        ("Author.read_page", 1, lambda: Author.read_page(20, after=1)),
+        ("TableVersion.read_versions", 1, lambda: TableVersion.read_versions(("book", "author"))),
+        ("feed.read_feed", 2, lambda: feed.read_feed(reader_id, 20)),
+        ("recommendations.similar_books", 2, lambda: recommendations.similar_books(id_book, 20)),
+        ("recommendations.recommend_books", 2, lambda: recommendations.recommend_books(reader_id, 20)),
+        ("similar_readers.similar_reader_ids", 3, lambda: similar_readers.similar_reader_ids(reader_id, 20)),
+    ]
+
+def full_scans(cursor, dialect, statement, parameters):
+    """Returns the tables the statement's plan reads without an index."""
+    if dialect == "sqlite":
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        details = [row[-1] for row in cursor.fetchall()]
+        # Subqueries the plan materializes are scanned too, but they are not tables
+        derived = {match.group(1) for match in map(SQLITE_DERIVED.match, details) if match}
+        return [match.group(1) for match in map(SQLITE_SCAN.match, details) if match and "USING" not in match.string and match.group(1) not in derived]
+    if dialect == "postgresql":
+        cursor.execute("EXPLAIN " + statement, parameters)
+        return [match.group(1) for (line,) in cursor.fetchall() for match in [POSTGRES_SCAN.search(line)] if match]
+    cursor.execute("EXPLAIN " + statement, parameters)
+    columns = [column[0] for column in cursor.description]
+    plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    # Derived tables show up as <derived2>, <subquery3>...
+    return [row["table"] for row in plan if row.get("type") == "ALL" and row.get("table") and not row["table"].startswith("<")]
+
+def check_read(engine, name, max_queries, call):
+    """Returns the problems found with one read method."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with assert_max_queries(engine, max_queries):
+            call()
+    except AssertionError as error:
+        return [f"{name}: {error}"]
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    problems = []
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == "postgresql":
+            # Small tables make a sequential scan the cheaper plan; this only leaves it when no index applies.
+            # SET LOCAL ends with the transaction, which the pool rolls back when the connection is returned
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for statement, parameters in statements:
+            for table in full_scans(cursor, engine.dialect.name, statement, parameters):
+                problems.append(f"{name}: full scan of {table} in {statement}")
+    finally:
+        connection.close()
+    return problems
+
+@click.command("check-indexes")
+@with_appcontext
+def check_indexes():
+    """Fails when a model read method scans a whole table or runs more queries than it should."""
+    if not db.session.query(Book.query.exists()).scalar():
+        print("The database has no books, seeding a synthetic dataset")
+        load_generated_data(**SEED_SIZES)
+    engine = db.engine
+    checks = read_checks(sample_arguments())
+    problems = []
+    for name, max_queries, call in checks:
+        problems.extend(check_read(engine, name, max_queries, call))
+        db.session.rollback()
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise click.ClickException(f"{len(problems)} problems in {len(checks)} read methods")
+    print(f"{len(checks)} read methods use an index for every table they filter")
@@ -1,21 +1,32 @@
+import io
 import os
 
 import click
 import flask_migrate
 from flask import Flask
 from flask.cli import with_appcontext
-from sqlalchemy import create_engine, Table
+from sqlalchemy import create_engine, Table, func, select, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy_utils import create_database, database_exists
 
 import models
+from conditional import bump_committed_versions, mark_written
 from seed_data import data
 
+# Unquoted NULL marker for COPY; every real value is quoted, so none can be read as NULL
+COPY_NULL = "\\N"
+
 
 @click.command()
+@click.option("--bulk", is_flag=True, help="Insert rows in batches, one transaction per table, instead of merging them one by one.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per INSERT batch in bulk mode.")
+@click.option("--copy", "use_copy", is_flag=True, help="Bulk mode only: load each table with COPY on Postgres.")
 @with_appcontext
-def init_db():
-    load_seed_data(data)
+def init_db(bulk, batch_size, use_copy):
+    if bulk:
+        load_seed_data_bulk(data, batch_size, use_copy)
+    else:
+        load_seed_data(data)
 
 def load_seed_data(data):
     for table, rows in data.items():
@@ -25,7 +36,7 @@ def load_seed_data(data):
             if isinstance(ModelClass, Table):
                 insert = ModelClass.insert().values(**row)
                 try:
-                    models.db.session.execute(insert) 
+                    models.db.session.execute(insert)
                     models.db.session.commit()
                 except IntegrityError as e:
                     print(f'ERROR: inserting row {row} in "{table}". IGNORING')
@@ -35,3 +46,84 @@ def load_seed_data(data):
                 new_row = ModelClass(**row)
                 models.db.session.merge(new_row)
                 models.db.session.commit()
+
+def get_table(name):
+    ModelClass = getattr(models, name)
+    return ModelClass if isinstance(ModelClass, Table) else ModelClass.__table__
+
+def in_dependency_order(data):
+    """Yields (table, rows) so that every table comes after the tables its foreign keys point to."""
+    tables = {get_table(name): rows for name, rows in data.items()}
+    for table in models.db.Model.metadata.sorted_tables:
+        if table in tables:
+            yield table, tables[table]
+
+def batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+def load_seed_data_bulk(data, batch_size=1000, use_copy=False):
+    engine = models.db.engine
+    for table, rows in in_dependency_order(data):
+        with engine.begin() as conn:
+            if use_copy and engine.dialect.name == "postgresql" and copy_rows(conn, table, rows):
+                loaded = len(rows)
+                # COPY goes around the Engine, so its after_execute hooks never see the write
+                mark_written(conn, table.name)
+            else:
+                loaded = insert_rows(conn, table, rows, batch_size)
+            if engine.dialect.name == "postgresql":
+                reset_sequence(conn, table)
+        bump_committed_versions()
+        print(f'Loaded {loaded} of {len(rows)} rows in "{table.name}"')
+
+def insert_rows(conn, table, rows, batch_size):
+    loaded = 0
+    for batch in batches(rows, batch_size):
+        try:
+            with conn.begin_nested():
+                conn.execute(table.insert(), batch)
+            loaded += len(batch)
+        except IntegrityError:
+            # Retry the failing batch row by row so only the offending rows are skipped
+            for row in batch:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert(), row)
+                    loaded += 1
+                except IntegrityError as e:
+                    print(f'ERROR: inserting row {row} in "{table.name}". IGNORING')
+                    print(e)
+    return loaded
+
+def copy_field(value):
+    if value is None:
+        return COPY_NULL
+    text_value = str(value).replace('"', '""')
+    return f'"{text_value}"'
+
+def copy_rows(conn, table, rows):
+    """Loads the rows with a single COPY. Returns False when COPY fails, so the caller can fall back to batched inserts."""
+    columns = [column.name for column in table.columns if any(column.name in row for row in rows)]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(copy_field(row.get(column)) for column in columns) + "\n")
+    buffer.seek(0)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    try:
+        with conn.begin_nested():
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(f"COPY \"{table.name}\" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+        return True
+    except conn.dialect.dbapi.Error as e:
+        print(f'COPY into "{table.name}" failed, falling back to batched inserts')
+        print(e)
+        return False
+
+def reset_sequence(conn, table):
+    # Rows are loaded with explicit ids, so move the id sequence past them
+    if "id" not in table.c or not table.c.id.primary_key:
+        return
+    max_id = conn.execute(select([func.max(table.c.id)])).scalar()
+    if max_id is not None:
+        conn.execute(text("SELECT setval(pg_get_serial_sequence(:table_name, 'id'), :max_id)"), table_name=f'"{table.name}"', max_id=max_id)
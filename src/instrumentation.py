@@ -0,0 +1,124 @@
+"""
+Per-request SQL instrumentation.
+
+Counts the queries each request runs and the time spent in the database
+and in JSON serialization, reports them in a Server-Timing header, keeps per-route histograms for the
+/metrics endpoint (Prometheus text format) and logs slow statements.
+Metrics are per process: each gunicorn worker reports its own.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 500]
+
+slow_query_logger = logging.getLogger("slow_queries")
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.observations = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.observations += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total}")
+        lines.append(f"{name}_count{{{labels}}} {self.observations}")
+        return lines
+
+HISTOGRAMS = (
+    ("http_request_duration_seconds", "Time spent handling the request.", DURATION_BUCKETS),
+    ("http_request_db_seconds", "Time spent waiting on the database per request.", DURATION_BUCKETS),
+    ("http_request_serialize_seconds", "Time spent encoding the response to JSON per request.", DURATION_BUCKETS),
+    ("http_request_queries", "SQL statements executed per request.", QUERY_BUCKETS),
+)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = []
+
+def register_counter(name, help_text, read_value):
+    """Adds a counter owned by another module (read_value is called on every scrape) to /metrics."""
+    _counters.append((name, help_text, read_value))
+
+def route_name():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    if not has_request_context():
+        return
+    g.query_count = g.get("query_count", 0) + 1
+    g.db_time = g.get("db_time", 0) + duration
+    if duration * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning("%.1f ms in %s %s: %s", duration * 1000, request.method, route_name(), statement)
+
+def forget_failed_query(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+def record_request(response):
+    total = time.perf_counter() - g.get("request_started", time.perf_counter())
+    db_time = g.get("db_time", 0)
+    serialize_time = g.get("serialize_time", 0)
+    query_count = g.get("query_count", 0)
+    # app is what is left: routing, row handling and the view's own work
+    response.headers["Server-Timing"] = (
+        f"db;dur={db_time * 1000:.2f};desc=\"{query_count} queries\", ser;dur={serialize_time * 1000:.2f}, "
+        f"app;dur={(total - db_time - serialize_time) * 1000:.2f}, total;dur={total * 1000:.2f}"
+    )
+    labels = f'method="{request.method}",route="{route_name()}",status="{response.status_code}"'
+    with _lock:
+        for (name, help_text, buckets), value in zip(HISTOGRAMS, (total, db_time, serialize_time, query_count)):
+            series = _histograms.setdefault(name, {})
+            if labels not in series:
+                series[labels] = Histogram(buckets)
+            series[labels].observe(value)
+    return response
+
+def render_metrics():
+    lines = []
+    with _lock:
+        for name, help_text, buckets in HISTOGRAMS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(_histograms.get(name, {}).items()):
+                lines.extend(histogram.render(name, labels))
+    for name, help_text, read_value in _counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {read_value()}")
+    return "\n".join(lines) + "\n"
+
+def init_app(app):
+    app.before_request(start_timer)
+    app.after_request(record_request)
+
+event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+event.listen(Engine, "handle_error", forget_failed_query)
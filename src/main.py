@@ -6,12 +6,27 @@ from flask import Flask, request, jsonify, url_for, make_response, request
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS, cross_origin
-from utils import APIException, generate_sitemap, token_required
+from utils import APIException, generate_sitemap, get_page_args, page_response, get_stream_format, stream_response, json_response, get_fields, MAX_PAGE_SIZE
 from admin import setup_admin
-from models import db, Reader, Author, Book, Review, Order, Shelf, written_by, follower
+from models import db, Reader, Author, Book, Review, Order, Shelf, written_by
 from init_database import init_db
+from generate_data import generate_data
+from benchmark import benchmark, benchmark_catalog, benchmark_loading, benchmark_passwords, benchmark_search, benchmark_serialization, benchmark_similar_readers
+from index_check import check_indexes
+import search
+import cache
+from conditional import conditional_get
+import instrumentation
+from db_config import engine_options
+import routing
+import auth
+import passwords
+import feed
+import recommendations
+import similar_readers
+import follow_graph
+import shelf_batch
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
 import datetime
 
 app = Flask(__name__)
@@ -19,13 +34,32 @@ app.url_map.strict_slashes = False
 app.config['SECRET_KEY']= os.environ.get("FLASK_APP_KEY")
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_BINDS'] = routing.replica_binds(os.environ.get('DB_REPLICA_CONNECTION_STRINGS'))
 
 MIGRATE = Migrate(app, db)
 db.init_app(app)
 
 CORS(app)
+instrumentation.init_app(app)
+routing.init_app(app)
+instrumentation.register_counter("response_cache_hits_total", "Responses served from the response cache.", lambda: cache.stats["hits"])
+instrumentation.register_counter("response_cache_misses_total", "Responses built because they were not cached.", lambda: cache.stats["misses"])
+instrumentation.register_counter("response_cache_invalidations_total", "Times the response cache was cleared by a write.", lambda: cache.stats["invalidations"])
 setup_admin(app)
 app.cli.add_command(init_db)
+app.cli.add_command(generate_data)
+app.cli.add_command(benchmark)
+app.cli.add_command(benchmark_catalog)
+app.cli.add_command(benchmark_loading)
+app.cli.add_command(benchmark_passwords)
+app.cli.add_command(benchmark_search)
+app.cli.add_command(benchmark_serialization)
+app.cli.add_command(benchmark_similar_readers)
+app.cli.add_command(check_indexes)
+app.cli.add_command(feed.trim_timelines_command)
+app.cli.add_command(recommendations.build_recommendations)
+app.cli.add_command(similar_readers.build_reader_signatures)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -41,7 +75,7 @@ def sitemap():
 def register():  
     body = request.get_json()  
 
-    hashed_password = generate_password_hash(body["password"], method="sha256")
+    hashed_password = passwords.hash_password(body["password"])
 
     new_user = Reader(email=body['email'], password=hashed_password, is_active= True, username=body["username"])
 
@@ -59,80 +93,95 @@ def login():
 
         reader = Reader.read_by_email(body["email"])
 
-        if check_password_hash(reader.password, body["password"]):
+        if reader and passwords.verify_password(reader.password, body["password"]):
+            if passwords.needs_rehash(reader.password):
+                try:
+                    Reader.update_password(reader, passwords.hash_password(body["password"]))
+                except passwords.HashingBusy:
+                    # The password was right; the hash is replaced on a later login instead
+                    pass
             token = jwt.encode({'id': reader.id, 'exp' : datetime.datetime.utcnow() + datetime.timedelta(minutes=30)}, app.config['SECRET_KEY'])
             return jsonify({'token' : token.decode('UTF-8')}), 200
 
         return make_response("Error de login", 401)
 
     else:
+        auth.read_claims(request.headers["x-access-tokens"])
         return make_response("Token válido", 200)
 
 @app.route('/readers', methods=['GET'])
+@conditional_get("reader")
 def get_all_readers():  
-    readers = Reader.read_all() 
-    result = []
-
-    for reader in readers:
-        reader_data = {}   
-        reader_data['id'] = reader["id"]  
-        reader_data['email'] = reader["email"] 
-        reader_data["username"] = reader["username"]
-        reader_data["name"] = reader["name"]
-        reader_data["description"] = reader["description"]
-       
-        result.append(reader_data)   
+    page_args = get_page_args(request.args)
+    fields = get_fields(request.args, Reader.schema)
+    if page_args:
+        readers = Reader.read_page(*page_args, fields=fields)
+        return page_response(readers, page_args[0])
+    return json_response(Reader.read_all(fields))
+
+def get_search_limit(args):
+    try:
+        return min(int(args.get("limit", MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise APIException("limit must be an integer")
 
-    return jsonify(result)
+@app.route('/search', methods=['GET'])
+@cross_origin()
+@conditional_get("book", "author", "written_by")
+@cache.cached_response
+def search_catalog():
+    query = request.args.get("q", "")
+    limit = get_search_limit(request.args)
+    return json_response({
+        "books": search.search_books(query, limit),
+        "authors": search.search_authors(query, limit)
+    })
 
 @app.route('/books', methods=['GET'])
 @cross_origin()
+@conditional_get("book", "author", "written_by", "review")
+@cache.cached_response
 def get_all_books(): 
     args = request.args
     if "title" in args:
-        title = args["title"]
-        title = f"%{title}%"
-        book = Book.read_like_title(title)
-        return jsonify(book), 200
+        book = search.search_books(args["title"], get_search_limit(args), get_fields(args, Book.schema))
+        return json_response(book)
+    fields = get_fields(args, Book.list_schema)
+    stream_format = get_stream_format(request)
+    if stream_format:
+        return stream_response(Book.stream_all_with_authors(fields), stream_format)
+    page_args = get_page_args(args)
+    if page_args:
+        books = Book.read_page_with_authors(*page_args, fields=fields)
+        return page_response(books, page_args[0])
     else:
-        books = Book.read_all()
-        authors = Author.read_all()
-        books_written_by_authors = db.session.query(written_by).all()
-        result = []   
-        for book_author in books_written_by_authors:
-            for book in books:
-                for author in authors:
-                    if book["id"] == book_author[1]:
-                        if author["id"] == book_author[0]:
-                            book_data = {}   
-                            book_data['id'] = book["id"] 
-                            book_data['title'] = book["title"] 
-                            book_data["image"] = book["image"]
-                            book_data["synopsis"] = book["synopsis"]
-                            book_data["format_type"] = book["format_type"]
-                            book_data["genre"] = book["genre"]
-                            book_data["price"] = book["price"]
-                            book_data["id_author"] = author["id"]
-                            book_data["name_author"] = author["name"]
-                
-                            result.append(book_data)
-        return jsonify(result)
+        result = Book.read_all_with_authors(top_rated=args.get("sort") == "top_rated", fields=fields)
+        return json_response(result)
     
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return instrumentation.render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(cache.stats), 200
+
 @app.route('/<reader_id>/<shelf_name>/books', methods=['GET'])
 @cross_origin()
+@conditional_get("shelf", "book")
 def get_all_shelves(reader_id, shelf_name):
-    books_in_shelf = Shelf.read_by_reader_and_name(shelf_name, reader_id)
-
-    books=[]
-    for book in books_in_shelf:
-        books.append(Book.read_by_id(book['id_book']))
-    return jsonify(books), 200
+    books = Shelf.read_books_by_reader_and_name(shelf_name, reader_id)
+    return json_response(books)
 
 @app.route('/shelves_by_id', methods=['GET'])
+@conditional_get("shelf")
 def read_all_shelves():
+    stream_format = get_stream_format(request)
+    if stream_format:
+        return stream_response(Shelf.stream_all(), stream_format)
     try:
         shelves=Shelf.read_all_shelves()
-        return jsonify(shelves), 200
+        return json_response(shelves)
     except:
         return 'not found', 400
 
@@ -146,6 +195,13 @@ def add_to_shelf(reader_id,shelf_name,book_id):
 
     return jsonify(new_book_in_shelf.serialize())
 
+@app.route('/<int:reader_id>/shelves/batch', methods=['POST'])
+@cross_origin()
+def batch_shelves(reader_id):
+    body = request.get_json()
+    results = shelf_batch.apply(reader_id, body.get("operations") if isinstance(body, dict) else None)
+    return json_response({"results": results})
+
 @app.route('/<id_reader>/<shelf_name>/<id_book>' , methods=['DELETE'])
 @cross_origin()
 def delete_book_of_shelf(id_reader,shelf_name,id_book):
@@ -156,39 +212,52 @@ def delete_book_of_shelf(id_reader,shelf_name,id_book):
         return delete_book.serialize(), 200
         
 @app.route('/authors', methods=['GET'])
+@conditional_get("author")
+@cache.cached_response
 def get_all_authors():
     args = request.args
+    fields = get_fields(args, Author.schema)
     if "name" in args:
-        name = args["name"]
-        name = f"%{name}%"
-        author = Author.read_like_author(name)
-        return jsonify(author), 200
+        author = search.search_authors(args["name"], get_search_limit(args), fields)
+        return json_response(author)
+    page_args = get_page_args(args)
+    if page_args:
+        authors = Author.read_page(*page_args, fields=fields)
+        return page_response(authors, page_args[0])
     else:
         try:
-            all_authors = Author.read_all()
-            return jsonify(all_authors), 200
+            all_authors = Author.read_all(fields)
+            return json_response(all_authors)
         except:
             return "Do not found authors", 400
 
 @app.route("/author/<name_input>", methods=["GET"])
+@conditional_get("author")
+@cache.cached_response
 def get_author(name_input):
     try:
         author = Author.read(name_input)
-        return jsonify(author), 200
+        return json_response(author)
     except:
         return "Author not found", 400
 
 @app.route("/profile", methods=["GET"])
+@conditional_get("shelf")
 def get_shelves():
+    stream_format = get_stream_format(request)
+    if stream_format:
+        return stream_response(Shelf.stream_all(), stream_format)
     all_shelves = Shelf.read_all_shelves()
     if all_shelves:
-        return jsonify(all_shelves), 200
+        return json_response(all_shelves)
     else:
         return "Self not found", 400
 
 @app.route('/profile/<int:id_reader>', methods=['PUT'])
-# @token_required
-def update_reader(id_reader):
+@auth.token_required
+def update_reader(current_reader, id_reader):
+    if current_reader["id"] != id_reader:
+        raise APIException("You can only update your own profile", status_code=403)
     body=request.get_json()
     reader_to_update = Reader.update(id_reader, body["name"], body["description"])
     if reader_to_update:
@@ -197,26 +266,32 @@ def update_reader(id_reader):
         return "Couldn't update reader information", 404
 
 @app.route('/reviews', methods=['GET'])
+@conditional_get("review", "reader")
 def get_all_reviews():  
-    reviews = Review.read_all()
-    readers = Reader.read_all()
-
-    result = []   
-
-    for review in reviews:
-        for reader in readers:
-            if reader["id"] == review["id_reader"]:
-                review_data = {}   
-                review_data['id'] = review["id"] 
-                review_data['id_reader'] = review["id_reader"] 
-                review_data["id_book"] = review["id_book"]
-                review_data["stars"] = review["stars"]
-                review_data["review"] = review["review"]
-                review_data["username"] = reader["username"]
-       
-                result.append(review_data)
-    
-    return jsonify(result)
+    stream_format = get_stream_format(request)
+    if stream_format:
+        return stream_response(Review.stream_all(), stream_format)
+    page_args = get_page_args(request.args)
+    if page_args:
+        reviews = Review.read_page(*page_args)
+        return page_response(reviews, page_args[0])
+
+    result = Review.read_all_with_usernames()
+    return json_response(result)
+
+@app.route('/books/<int:id_book>/reviews', methods=['GET'])
+@cross_origin()
+@conditional_get("review", "reader")
+def get_book_reviews(id_book):
+    page_args = get_page_args(request.args) or (MAX_PAGE_SIZE, None)
+    reviews = Review.read_page_by_book(id_book, *page_args)
+    return page_response(reviews, page_args[0])
+
+@app.route('/books/<int:id_book>/similar', methods=['GET'])
+@cross_origin()
+def get_similar_books(id_book):
+    books = recommendations.similar_books(id_book, get_search_limit(request.args))
+    return json_response(books)
 
 @app.route('/add_review', methods=['POST'])
 def add_review():  
@@ -231,31 +306,90 @@ def add_review():
 @app.route("/following/<int:id_user_logged>", methods=["POST"])
 def add_follower(id_user_logged):
     body=request.get_json()
-    statement = follower.insert().values(id_follower=id_user_logged, id_followed=body["id_followed"])
-    db.session.execute(statement)
-    db.session.commit()
+    follow_graph.follow(id_user_logged, int(body["id_followed"]))
     return jsonify({"message": "Logged user is following a new user!"}), 200
 
 @app.route("/following_followed", methods=["GET"])
 @cross_origin()
 def read_followers():
-    readers = Reader.read_all()
-    followers = db.session.query(follower).all()
-    each_data = []
-    result = []
-    for each_follower in followers:
-        for reader in readers:
-            follower_data = {}
-            follower_username = Reader.read_username_by_id(each_follower[0])
-            if reader["id"] == each_follower[1]:
-                follower_data["id_followed"] = each_follower[1]
-                follower_data["username_followed"] = reader["username"]
-                follower_data["id_follower"] = each_follower[0]
-                follower_data["username_follower"] = follower_username
-            
-                result.append(follower_data)
-
-    return jsonify(result)
+    result = Reader.read_follow_graph()
+    return json_response(result)
+
+@app.route("/readers/<int:id_reader>/followers", methods=["GET"])
+@cross_origin()
+def get_reader_followers(id_reader):
+    page_args = get_page_args(request.args)
+    if page_args:
+        followers = Reader.read_followers(id_reader, *page_args)
+        return page_response(followers, page_args[0])
+    followers = Reader.read_followers(id_reader)
+    return json_response(followers)
+
+@app.route("/readers/<int:id_reader>/following", methods=["GET"])
+@cross_origin()
+def get_reader_following(id_reader):
+    page_args = get_page_args(request.args)
+    if page_args:
+        following = Reader.read_following(id_reader, *page_args)
+        return page_response(following, page_args[0])
+    following = Reader.read_following(id_reader)
+    return json_response(following)
+
+@app.route("/readers/<int:id_reader>/recommendations", methods=["GET"])
+@cross_origin()
+def get_reader_recommendations(id_reader):
+    books = recommendations.recommend_books(id_reader, get_search_limit(request.args))
+    return json_response(books)
+
+@app.route("/readers/<int:id_reader>/following/<int:id_other>", methods=["GET"])
+@cross_origin()
+def get_relationship(id_reader, id_other):
+    return json_response(follow_graph.relationship(id_reader, id_other))
+
+@app.route("/readers/<int:id_reader>/following/<int:id_followed>", methods=["PUT"])
+@cross_origin()
+@auth.token_required
+def follow_reader(current_reader, id_reader, id_followed):
+    if current_reader["id"] != id_reader:
+        raise APIException("You can only follow readers as yourself", status_code=403)
+    if id_reader == id_followed:
+        raise APIException("You can't follow yourself")
+    created = follow_graph.follow(id_reader, id_followed)
+    return json_response(follow_graph.relationship(id_reader, id_followed), status=201 if created else 200)
+
+@app.route("/readers/<int:id_reader>/following/<int:id_followed>", methods=["DELETE"])
+@cross_origin()
+@auth.token_required
+def unfollow_reader(current_reader, id_reader, id_followed):
+    if current_reader["id"] != id_reader:
+        raise APIException("You can only unfollow readers as yourself", status_code=403)
+    if not follow_graph.unfollow(id_reader, id_followed):
+        raise APIException("You don't follow this reader", status_code=404)
+    return json_response(follow_graph.relationship(id_reader, id_followed))
+
+@app.route("/readers/<int:id_reader>/follow_counts", methods=["GET"])
+@cross_origin()
+def get_follow_counts(id_reader):
+    return json_response(follow_graph.follow_counts(id_reader))
+
+@app.route("/readers/<int:id_reader>/suggestions", methods=["GET"])
+@cross_origin()
+def get_follow_suggestions(id_reader):
+    readers = follow_graph.suggestions(id_reader, get_search_limit(request.args))
+    return json_response(readers)
+
+@app.route("/readers/<int:id_reader>/similar", methods=["GET"])
+@cross_origin()
+def get_similar_readers(id_reader):
+    readers = similar_readers.similar_readers(id_reader, get_search_limit(request.args))
+    return json_response(readers)
+
+@app.route("/readers/<int:id_reader>/feed", methods=["GET"])
+@cross_origin()
+def get_reader_feed(id_reader):
+    page_args = get_page_args(request.args) or (MAX_PAGE_SIZE, None)
+    activities = feed.read_feed(id_reader, *page_args)
+    return page_response(activities, page_args[0])
 
 
 
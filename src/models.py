@@ -1,11 +1,34 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, ForeignKey, Integer, String, Enum, Boolean, Text, Float, Table
+from routing import RoutingSQLAlchemy
+from sqlalchemy import Column, ForeignKey, Integer, BigInteger, String, Enum, Boolean, Text, Float, Table, Index, DateTime, LargeBinary
+from sqlalchemy import func, case, exists, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import aliased
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+# Rows fetched per round trip when a whole table is streamed
+STREAM_BATCH_SIZE = 500
+
+def schema_columns(model, fields=None):
+    """The columns listed in the model's schema, to select plain row tuples instead of ORM instances.
+    With fields, only those columns are selected, so unrequested text columns are never read."""
+    return [getattr(model, name) for name in model.schema if fields is None or name in fields]
+
+def read_rows(query):
+    return [row._asdict() for row in query]
+
+def insert_ignoring_duplicates(table):
+    """INSERT that skips rows whose key already exists, in the syntax of the connected database."""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql_insert(table).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return table.insert().prefix_with("IGNORE")
+    return table.insert().prefix_with("OR IGNORE")
 
 written_by = Table("written_by", db.Model.metadata,
     Column("id_author", Integer, ForeignKey("author.id"), primary_key=True),
-    Column("id_book", Integer, ForeignKey("book.id"), primary_key=True)
+    Column("id_book", Integer, ForeignKey("book.id"), primary_key=True, index=True)
 )
 
 order_line = Table("order_line", db.Model.metadata,
@@ -15,41 +38,72 @@ order_line = Table("order_line", db.Model.metadata,
 
 follower = Table("follower", db.Model.metadata,
     Column("id_follower", Integer, ForeignKey("reader.id"), primary_key=True),
-    Column("id_followed", Integer, ForeignKey("reader.id"), primary_key=True)
+    Column("id_followed", Integer, ForeignKey("reader.id"), primary_key=True, index=True)
 )
 
 class Review(db.Model):
     __tablename__ = "review"
+    __table_args__ = (
+        Index("ix_review_id_book_id", "id_book", "id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
-    id_reader = Column(Integer, ForeignKey("reader.id"), nullable=False, unique=False)
+    id_reader = Column(Integer, ForeignKey("reader.id"), nullable=False, unique=False, index=True)
     id_book = Column(Integer, ForeignKey("book.id"), nullable=False, unique=False)
     stars = Column(Enum("1", "2", "3", "4", "5"), nullable=False)
     review = Column(Text(), nullable=True)
     # relations
     book_review = db.relationship("Book", back_populates="readers_reviews")
     reader_review = db.relationship("Reader", back_populates="books_reviews")
+    schema = ("id", "id_reader", "id_book", "stars", "review")
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "id_reader": self.id_reader,
-            "id_book": self.id_book,
-            "stars": self.stars,
-            "review": self.review
-        }
+        return {name: getattr(self, name) for name in self.schema}
 
     def create(new_review):
         db.session.add(new_review)  
+        BookRating.add_review_stars(new_review.id_book, new_review.stars)
         db.session.commit()
 
     @classmethod
     def read_all(cls):
-        get_all_reviews = Review.query.all()
-        reviews = list(map(lambda x: x.serialize(), get_all_reviews))
-        return reviews
+        return read_rows(db.session.query(*schema_columns(cls)))
+
+    @classmethod
+    def query_with_usernames(cls):
+        return db.session.query(*schema_columns(cls), Reader.username).join(Reader, Reader.id == Review.id_reader)
+
+    @classmethod
+    def read_page(cls, limit, after=None):
+        reviews_page = cls.query_with_usernames()
+        if after is not None:
+            reviews_page = reviews_page.filter(Review.id > after)
+        reviews_page = reviews_page.order_by(Review.id).limit(limit)
+        return read_rows(reviews_page)
+
+    @classmethod
+    def read_all_with_usernames(cls):
+        reviews_with_usernames = cls.query_with_usernames().order_by(Review.id)
+        return read_rows(reviews_with_usernames)
+
+    @classmethod
+    def read_page_by_book(cls, id_book, limit, after=None):
+        reviews_page = cls.query_with_usernames().filter(Review.id_book == id_book)
+        if after is not None:
+            reviews_page = reviews_page.filter(Review.id > after)
+        reviews_page = reviews_page.order_by(Review.id).limit(limit)
+        return read_rows(reviews_page)
+
+    @classmethod
+    def stream_all(cls):
+        reviews = cls.query_with_usernames().order_by(Review.id).yield_per(STREAM_BATCH_SIZE)
+        for review in reviews:
+            yield review._asdict()
 
 class Shelf(db.Model):
     __tablename__= "shelf"
+    __table_args__ = (
+        Index("ix_shelf_id_reader_shelf_name", "id_reader", "shelf_name"),
+    )
     id_reader = Column(Integer, ForeignKey("reader.id"), primary_key=True)
     id_book = Column(Integer, ForeignKey("book.id"), primary_key=True)
     shelf_name = Column(Enum("Comentados","Leídos","Favoritos","Pendientes","Comprados"), primary_key=True)
@@ -57,37 +111,42 @@ class Shelf(db.Model):
     book_shelf = db.relationship("Book", back_populates="readers_shelves")
     reader_shelf = db.relationship("Reader", back_populates="books_shelves")
 
-    @classmethod
-    def read_all_shelves(cls):
-        get_all_shelves = Shelf.query.all()
-        shelves = list(map(lambda x: x.serialize(), get_all_shelves))
-        return shelves
+    schema = ("id_reader", "id_book", "shelf_name")
 
     def serialize(self):
-        return {
-            "id_reader": self.id_reader,
-            "id_book": self.id_book,
-            "shelf_name": self.shelf_name
-        }
+        return {name: getattr(self, name) for name in self.schema}
 
     @classmethod
     def read_by_reader_and_name(cls, shelf_name, reader_id):
-        books_in_shelf = cls.query.filter_by(shelf_name = shelf_name, id_reader = reader_id)
-        shelf = list(map(lambda x: x.serialize(), books_in_shelf))
-        return shelf
+        books_in_shelf = db.session.query(*schema_columns(cls)).filter_by(shelf_name = shelf_name, id_reader = reader_id)
+        return read_rows(books_in_shelf)
+
+    @classmethod
+    def read_books_by_reader_and_name(cls, shelf_name, reader_id):
+        books_in_shelf = db.session.query(*schema_columns(Book)).join(cls, cls.id_book == Book.id).filter(cls.shelf_name == shelf_name, cls.id_reader == reader_id)
+        return read_rows(books_in_shelf)
 
     @classmethod
     def read_all_shelves(cls):
-        shelves=Shelf.query.all()
-        all_shelf=list(map(lambda x: x.serialize(), shelves))
-        return all_shelf
+        return read_rows(db.session.query(*schema_columns(cls)))
+
+    @classmethod
+    def stream_all(cls):
+        shelves = db.session.query(*schema_columns(cls)).yield_per(STREAM_BATCH_SIZE)
+        for shelf in shelves:
+            yield shelf._asdict()
 
     def add_book_to_shelf(self):
+        # Adding a book that is already on the shelf is a no-op instead of a primary key violation
+        if Shelf.query.get((self.id_reader, self.id_book, self.shelf_name)) is not None:
+            return
         db.session.add(self)
         db.session.commit()
     
     def delete_book_on_shelf( id_reader, shelf_name, id_book ):
         book=Shelf.query.filter_by(id_reader=id_reader, shelf_name=shelf_name, id_book=id_book).first()
+        if book is None:
+            return None
         db.session.delete(book)
         db.session.commit()
         return book
@@ -98,7 +157,7 @@ class Reader(db.Model):
     image = Column(Text(), nullable=True)
     username = Column(String(80), unique=True, nullable=False)
     email = Column(String(120), unique=True, nullable=False)
-    password = Column(String(80), nullable=False)
+    password = Column(String(255), nullable=False)
     is_active = Column(Boolean(), nullable=False)
     name = Column(String(255), nullable=True)
     description = Column(Text(), nullable=True)
@@ -108,25 +167,65 @@ class Reader(db.Model):
     books_shelves = db.relationship("Shelf", back_populates="reader_shelf")
     readers = db.relationship("Reader", secondary=follower, primaryjoin=id == follower.c.id_follower, secondaryjoin=id == follower.c.id_followed, back_populates="readers")
     
+    schema = ("id", "username", "email", "name", "description")
+    # Fields shown when a reader is suggested to someone else
+    public_schema = ("id", "username", "name", "description")
+
     def serialize(self):
-        return {
-            "id": self.id,
-            "username": self.username,
-            "email": self.email,
-            "name": self.name,
-            "description": self.description,
-            "orders": self.orders
-        }
+        return {name: getattr(self, name) for name in self.schema}
     
     def read_username_by_id(id_reader):
         reader = Reader.query.filter_by(id = id_reader).first()
         return reader.username
 
     @classmethod
-    def read_all(cls):
-        readers = Reader.query.all()
-        all_readers = list(map(lambda x: x.serialize(), readers))
-        return all_readers
+    def read_by_ids(cls, reader_ids, fields=None):
+        readers_by_id = {reader["id"]: reader for reader in read_rows(db.session.query(*schema_columns(cls, fields)).filter(cls.id.in_(reader_ids)))} if reader_ids else {}
+        readers = [readers_by_id[reader_id] for reader_id in reader_ids if reader_id in readers_by_id]
+        return readers
+
+    @classmethod
+    def read_follow_graph(cls):
+        reader_follower = aliased(Reader)
+        reader_followed = aliased(Reader)
+        follow_edges = db.session.query(
+            follower.c.id_followed, reader_followed.username.label("username_followed"),
+            follower.c.id_follower, reader_follower.username.label("username_follower")
+        ).join(reader_follower, reader_follower.id == follower.c.id_follower).join(reader_followed, reader_followed.id == follower.c.id_followed)
+        graph = list(map(lambda x: x._asdict(), follow_edges))
+        return graph
+
+    @classmethod
+    def read_followers(cls, id_reader, limit=None, after=None):
+        followers = db.session.query(Reader.id, Reader.username).join(follower, follower.c.id_follower == Reader.id).filter(follower.c.id_followed == id_reader)
+        return cls._read_follow_page(followers, limit, after)
+
+    @classmethod
+    def read_following(cls, id_reader, limit=None, after=None):
+        following = db.session.query(Reader.id, Reader.username).join(follower, follower.c.id_followed == Reader.id).filter(follower.c.id_follower == id_reader)
+        return cls._read_follow_page(following, limit, after)
+
+    @classmethod
+    def _read_follow_page(cls, readers, limit, after):
+        if after is not None:
+            readers = readers.filter(Reader.id > after)
+        readers = readers.order_by(Reader.id)
+        if limit is not None:
+            readers = readers.limit(limit)
+        page = list(map(lambda x: x._asdict(), readers))
+        return page
+
+    @classmethod
+    def read_all(cls, fields=None):
+        return read_rows(db.session.query(*schema_columns(cls, fields)))
+
+    @classmethod
+    def read_page(cls, limit, after=None, fields=None):
+        readers = db.session.query(*schema_columns(cls, fields))
+        if after is not None:
+            readers = readers.filter(Reader.id > after)
+        readers = readers.order_by(Reader.id).limit(limit)
+        return read_rows(readers)
 
     def create(new_user):
         db.session.add(new_user)  
@@ -136,6 +235,10 @@ class Reader(db.Model):
         reader = Reader.query.filter_by(email=email).first()
         return reader
 
+    def update_password(reader, password_hash):
+        reader.password = password_hash
+        db.session.commit()
+
     def update(id_reader, name, description):
         reader_to_update = Reader.query.filter_by(id= id_reader).first()
         reader_to_update.name = name
@@ -157,17 +260,15 @@ class Book(db.Model):
     readers_shelves = db.relationship("Shelf", back_populates="book_shelf")
     authors = db.relationship("Author", secondary=written_by, back_populates="books")
     orders = db.relationship("Order", secondary=order_line, back_populates="books")
+    rating = db.relationship("BookRating", uselist=False, back_populates="book")
+
+    schema = ("id", "image", "title", "synopsis", "format_type", "genre", "price")
+    rating_fields = ("rating_count", "rating_average", "rating_histogram")
+    # Fields of the /books listing, which adds authors and ratings to every book
+    list_schema = schema + ("id_author", "name_author") + rating_fields
 
     def serialize(self):
-        return {
-            "id": self.id,
-            "image": self.image,
-            "title": self.title,
-            "synopsis": self.synopsis,
-            "format_type": self.format_type,
-            "genre": self.genre,
-            "price": self.price
-        }
+        return {name: getattr(self, name) for name in self.schema}
     
     @classmethod
     def read_by_id(cls, book_id):
@@ -177,54 +278,230 @@ class Book(db.Model):
 
     @classmethod
     def read_all(cls):
-        all_books = Book.query.all()
-        books = list(map(lambda x: x.serialize(), all_books))
+        return read_rows(db.session.query(*schema_columns(cls)))
+
+    @classmethod
+    def has_author_fields(cls, fields=None):
+        fields = fields or cls.list_schema
+        return "id_author" in fields or "name_author" in fields
+
+    @classmethod
+    def list_order(cls, fields=None):
+        # A book with several authors has one row per author, in author order
+        return (Book.id, written_by.c.id_author) if cls.has_author_fields(fields) else (Book.id,)
+
+    @classmethod
+    def query_with_authors(cls, fields=None, join_rating=False):
+        # Author and rating tables are only joined when one of their fields is requested
+        fields = fields or cls.list_schema
+        columns = schema_columns(cls, fields)
+        if "id_author" in fields:
+            columns.append(written_by.c.id_author)
+        if "name_author" in fields:
+            columns.append(Author.name.label("name_author"))
+        with_rating = any(field in cls.rating_fields for field in fields)
+        if with_rating:
+            columns.append(func.coalesce(BookRating.review_count, 0).label("rating_count"))
+            columns.append(func.coalesce(BookRating.stars_total, 0).label("rating_stars_total"))
+            columns.extend(func.coalesce(getattr(BookRating, f"stars_{stars}"), 0).label(f"rating_stars_{stars}") for stars in range(1, 6))
+        books_with_authors = db.session.query(*columns)
+        if cls.has_author_fields(fields):
+            books_with_authors = books_with_authors.join(written_by, written_by.c.id_book == Book.id)
+        else:
+            # Without author fields a join would repeat the book once per author; the listing still only shows written books
+            books_with_authors = books_with_authors.filter(exists().where(written_by.c.id_book == Book.id))
+        if "name_author" in fields:
+            books_with_authors = books_with_authors.join(Author, Author.id == written_by.c.id_author)
+        if with_rating or join_rating:
+            books_with_authors = books_with_authors.outerjoin(BookRating, BookRating.id_book == Book.id)
+        return books_with_authors
+
+    @classmethod
+    def serialize_with_authors(cls, row, fields=None):
+        book = row._asdict()
+        if "rating_stars_total" in book:
+            stars_total = book.pop("rating_stars_total")
+            book["rating_average"] = round(stars_total / book["rating_count"], 2) if book["rating_count"] else None
+            book["rating_histogram"] = [book.pop(f"rating_stars_{stars}") for stars in range(1, 6)]
+            for field in cls.rating_fields:
+                if fields and field not in fields:
+                    del book[field]
+        return book
+
+    @classmethod
+    def read_all_with_authors(cls, top_rated=False, fields=None):
+        books_with_authors = cls.query_with_authors(fields, join_rating=top_rated)
+        if top_rated:
+            books_with_authors = books_with_authors.order_by(func.coalesce(BookRating.stars_total * 1.0 / BookRating.review_count, 0).desc(), func.coalesce(BookRating.review_count, 0).desc())
+        books_with_authors = books_with_authors.order_by(*cls.list_order(fields))
+        books = [cls.serialize_with_authors(book, fields) for book in books_with_authors]
         return books
 
     @classmethod
-    def read_like_title(cls, title):
-        books_by_title = Book.query.filter(Book.title.like(title)).all()
-        books = list(map(lambda x: x.serialize(), books_by_title))
+    def read_page_with_authors(cls, limit, after=None, fields=None):
+        # Page over the written books first so a book with several authors is never split between pages
+        page = db.session.query(written_by.c.id_book.label("id")).distinct()
+        if after is not None:
+            page = page.filter(written_by.c.id_book > after)
+        page = page.order_by(written_by.c.id_book).limit(limit).subquery()
+        books_with_authors = cls.query_with_authors(fields).join(page, page.c.id == Book.id).order_by(*cls.list_order(fields))
+        books = [cls.serialize_with_authors(book, fields) for book in books_with_authors]
         return books
 
+    @classmethod
+    def stream_all_with_authors(cls, fields=None):
+        books_with_authors = cls.query_with_authors(fields).order_by(*cls.list_order(fields)).yield_per(STREAM_BATCH_SIZE)
+        for book in books_with_authors:
+            yield cls.serialize_with_authors(book, fields)
+
+    @classmethod
+    def read_by_ids(cls, book_ids, fields=None):
+        books_by_id = {book["id"]: book for book in read_rows(db.session.query(*schema_columns(cls, fields)).filter(cls.id.in_(book_ids)))} if book_ids else {}
+        books = [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id]
+        return books
+
+class BookRating(db.Model):
+    __tablename__ = "book_rating"
+    id_book = Column(Integer, ForeignKey("book.id"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    stars_total = Column(Integer, nullable=False, default=0)
+    stars_1 = Column(Integer, nullable=False, default=0)
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+    # relations
+    book = db.relationship("Book", back_populates="rating")
+
+    def serialize(self):
+        return {
+            "id_book": self.id_book,
+            "rating_count": self.review_count,
+            "rating_average": round(self.stars_total / self.review_count, 2) if self.review_count else None,
+            "rating_histogram": [self.stars_1, self.stars_2, self.stars_3, self.stars_4, self.stars_5]
+        }
+
+    @classmethod
+    def add_review_stars(cls, id_book, stars):
+        # Counters are bumped in SQL so concurrent reviews of the same book don't overwrite each other
+        stars_column = getattr(cls, f"stars_{stars}")
+        def bump():
+            return cls.query.filter_by(id_book=id_book).update({
+                cls.review_count: cls.review_count + 1,
+                cls.stars_total: cls.stars_total + int(stars),
+                stars_column: stars_column + 1
+            }, synchronize_session=False)
+        if not bump():
+            # First review of the book: create an empty row, unless a concurrent first review just did, then bump it
+            db.session.execute(insert_ignoring_duplicates(cls.__table__).values(id_book=id_book))
+            bump()
+
+    @classmethod
+    def rebuild(cls):
+        """Recomputes every aggregate from the review table, for reviews loaded without Review.create."""
+        stars_value = case([(Review.stars == str(stars), stars) for stars in range(1, 6)])
+        aggregates = select([
+            Review.id_book, func.count(), func.sum(stars_value),
+            *[func.sum(case([(Review.stars == str(stars), 1)], else_=0)) for stars in range(1, 6)]
+        ]).group_by(Review.id_book)
+        db.session.execute(cls.__table__.delete())
+        db.session.execute(cls.__table__.insert().from_select(
+            ["id_book", "review_count", "stars_total", "stars_1", "stars_2", "stars_3", "stars_4", "stars_5"], aggregates
+        ))
+        db.session.commit()
+
 class Author(db.Model):
     __tablename__ = "author"
     id = Column(Integer, primary_key=True)
-    name = Column(String(120), nullable=False)
+    name = Column(String(120), nullable=False, index=True)
     biography = Column(Text(), nullable=False)
     image = Column(Text(), nullable=True)
     books = db.relationship("Book", secondary=written_by, back_populates="authors")
 
+    schema = ("id", "name", "biography", "image")
+
     def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "biography": self.biography,
-            "image": self.image,
-        }
+        return {name: getattr(self, name) for name in self.schema}
     
     @classmethod
-    def read_all(cls):
-        authors = cls.query.all()
-        author = list(map(lambda x: x.serialize(), authors))
-        return author
+    def read_all(cls, fields=None):
+        return read_rows(db.session.query(*schema_columns(cls, fields)))
+
+    @classmethod
+    def read_page(cls, limit, after=None, fields=None):
+        authors = db.session.query(*schema_columns(cls, fields))
+        if after is not None:
+            authors = authors.filter(cls.id > after)
+        authors = authors.order_by(cls.id).limit(limit)
+        return read_rows(authors)
         
     @classmethod
     def read(cls, name_input):
-        author = cls.query.filter_by(name = name_input)
-        return author.serialize()
+        author = db.session.query(*schema_columns(cls)).filter_by(name = name_input).first()
+        return author._asdict()
 
     @classmethod
-    def read_like_author(cls, name):
-        info_from_author = Author.query.filter(Author.name.like(name)).all()
-        authors = list(map(lambda x: x.serialize(), info_from_author))
+    def read_by_ids(cls, author_ids, fields=None):
+        authors_by_id = {author["id"]: author for author in read_rows(db.session.query(*schema_columns(cls, fields)).filter(cls.id.in_(author_ids)))} if author_ids else {}
+        authors = [authors_by_id[author_id] for author_id in author_ids if author_id in authors_by_id]
         return authors
 
+class TableVersion(db.Model):
+    __tablename__ = "table_version"
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(), nullable=True)
+
+    @classmethod
+    def read_versions(cls, table_names):
+        versions = cls.query.filter(cls.table_name.in_(table_names))
+        return {version.table_name: (version.version, version.updated_at) for version in versions}
+
+class BookSimilarity(db.Model):
+    """Nearest neighbours of each book, precomputed by `flask build-recommendations`."""
+    __tablename__ = "book_similarity"
+    id_book = Column(Integer, ForeignKey("book.id"), primary_key=True)
+    id_similar = Column(Integer, ForeignKey("book.id"), primary_key=True)
+    score = Column(Float(), nullable=False)
+
+class ReaderSignature(db.Model):
+    """MinHash signature of the set of books on a reader's shelves."""
+    __tablename__ = "reader_signature"
+    id_reader = Column(Integer, ForeignKey("reader.id"), primary_key=True)
+    signature = Column(LargeBinary(), nullable=False)
+
+class ReaderBucket(db.Model):
+    """LSH index: readers whose signatures agree on a whole band share its bucket."""
+    __tablename__ = "reader_bucket"
+    band = Column(Integer, primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)
+    id_reader = Column(Integer, ForeignKey("reader.id"), primary_key=True, index=True)
+
+class Activity(db.Model):
+    """A review or shelf entry, as shown in the feeds of the reader's followers."""
+    __tablename__ = "activity"
+    __table_args__ = (
+        Index("ix_activity_id_reader_id", "id_reader", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    id_reader = Column(Integer, ForeignKey("reader.id"), nullable=False)
+    kind = Column(String(20), nullable=False)
+    id_book = Column(Integer, ForeignKey("book.id"), nullable=False)
+    id_review = Column(Integer, ForeignKey("review.id"), nullable=True)
+    shelf_name = Column(String(20), nullable=True)
+    created_at = Column(DateTime(), nullable=False)
+
+class TimelineEntry(db.Model):
+    """Precomputed feed: one row per activity per follower, read as a range of the primary key."""
+    __tablename__ = "timeline_entry"
+    id_owner = Column(Integer, ForeignKey("reader.id"), primary_key=True)
+    id_activity = Column(Integer, ForeignKey("activity.id"), primary_key=True)
+
 class Order(db.Model):
     __tablename__= "order"
     id = Column(Integer, primary_key=True)
     final_price =  Column(Float(), nullable=False)
-    reader_id = Column(Integer, ForeignKey("reader.id"))
+    reader_id = Column(Integer, ForeignKey("reader.id"), index=True)
     books = db.relationship("Book", secondary=order_line, back_populates="orders")
 
     def serialize(self):
@@ -0,0 +1,94 @@
+"""
+Password hashing.
+
+PASSWORD_HASHER picks the algorithm ("pbkdf2" or "scrypt") and
+PASSWORD_HASH_COST its work factor (PBKDF2 iterations, or the scrypt N
+parameter). At most PASSWORD_HASH_THREADS request threads of a worker hash
+at once. A request that can't get a slot within PASSWORD_HASH_WAIT seconds
+is answered with 503, so a burst of logins can't tie up every request thread
+of a gthread worker. Stored hashes made with another algorithm or cost,
+including the plaintext seed passwords, still verify and are replaced on the
+next successful login.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from utils import APIException
+
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASH_COST = os.environ.get("PASSWORD_HASH_COST")
+PASSWORD_HASH_THREADS = int(os.environ.get("PASSWORD_HASH_THREADS", 2))
+PASSWORD_HASH_WAIT = float(os.environ.get("PASSWORD_HASH_WAIT", 0.5))
+
+class HashingBusy(APIException):
+    status_code = 503
+
+    def __init__(self):
+        APIException.__init__(self, "Too many logins at once, try again in a moment")
+
+class PBKDF2Hasher:
+    default_cost = 150000
+
+    def __init__(self, cost=None):
+        self.method = f"pbkdf2:sha256:{int(cost or self.default_cost)}"
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method, salt_length=16)
+
+    def owns(self, password_hash):
+        return password_hash.startswith(self.method + "$")
+
+class ScryptHasher:
+    default_cost = 2 ** 14
+    block_size = 8
+    parallelization = 1
+
+    def __init__(self, cost=None):
+        self.method = f"scrypt:{int(cost or self.default_cost)}:{self.block_size}:{self.parallelization}"
+
+    def hash(self, password):
+        salt = secrets.token_hex(16)
+        return f"{self.method}${salt}${scrypt(self.method, salt, password)}"
+
+    def owns(self, password_hash):
+        return password_hash.startswith(self.method + "$")
+
+HASHERS = {"pbkdf2": PBKDF2Hasher, "scrypt": ScryptHasher}
+
+def scrypt(method, salt, password):
+    n, r, p = (int(value) for value in method.split(":")[1:])
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=256 * n * r).hex()
+
+def check(password_hash, password):
+    if password_hash.startswith("scrypt:"):
+        method, salt, expected = password_hash.split("$", 2)
+        return hmac.compare_digest(scrypt(method, salt, password), expected)
+    if password_hash.count("$") >= 2:
+        return check_password_hash(password_hash, password)
+    # Seed data stores passwords in plain text
+    return hmac.compare_digest(password_hash.encode(), password.encode())
+
+hasher = HASHERS[PASSWORD_HASHER](PASSWORD_HASH_COST)
+slots = threading.BoundedSemaphore(PASSWORD_HASH_THREADS)
+
+def run_hash(function, *args):
+    if not slots.acquire(timeout=PASSWORD_HASH_WAIT):
+        raise HashingBusy()
+    try:
+        return function(*args)
+    finally:
+        slots.release()
+
+def hash_password(password):
+    return run_hash(hasher.hash, password)
+
+def verify_password(password_hash, password):
+    return run_hash(check, password_hash, password)
+
+def needs_rehash(password_hash):
+    return not hasher.owns(password_hash)
@@ -0,0 +1,47 @@
+"""
+Item-to-item book recommendations from shelf co-occurrence.
+
+`flask build-recommendations` stores the top K neighbours of every book in
+book_similarity, from the cosine similarity of the books' reader vectors
+(see book_similarity.py). Requests only read that table.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, desc, func, select
+
+from models import db, Book, BookSimilarity, Review, Shelf
+
+SHELF_WEIGHTS = {"Favoritos": 3, "Leídos": 2, "Comentados": 2, "Comprados": 1.5, "Pendientes": 1}
+# A reviewed book that is on no shelf counts as read
+REVIEW_BASE_WEIGHT = SHELF_WEIGHTS["Leídos"]
+STARS_ADJUSTMENT = {"1": -2, "2": -1, "3": 0, "4": 0.5, "5": 1}
+
+def with_scores(scores):
+    scores = dict(scores)
+    books = Book.read_by_ids(list(scores))
+    for book in books:
+        book["score"] = round(scores[book["id"]], 4)
+    return books
+
+def similar_books(id_book, limit):
+    neighbours = db.session.query(BookSimilarity.id_similar, BookSimilarity.score).filter(BookSimilarity.id_book == id_book).order_by(BookSimilarity.score.desc()).limit(limit)
+    return with_scores(neighbours)
+
+def recommend_books(id_reader, limit):
+    """Neighbours of the reader's shelved books, weighted by shelf, leaving out books the reader already has."""
+    shelf_weight = case([(Shelf.shelf_name == shelf_name, weight) for shelf_name, weight in SHELF_WEIGHTS.items()], else_=1)
+    shelved = select([Shelf.id_book]).where(Shelf.id_reader == id_reader)
+    reviewed = select([Review.id_book]).where(Review.id_reader == id_reader)
+    score = func.sum(BookSimilarity.score * shelf_weight).label("score")
+    candidates = db.session.query(BookSimilarity.id_similar, score).join(Shelf, Shelf.id_book == BookSimilarity.id_book).filter(
+        Shelf.id_reader == id_reader, ~BookSimilarity.id_similar.in_(shelved), ~BookSimilarity.id_similar.in_(reviewed)
+    ).group_by(BookSimilarity.id_similar).order_by(desc("score"), BookSimilarity.id_similar).limit(limit)
+    return with_scores(candidates)
+
+@click.command("build-recommendations")
+@click.option("--top-k", default=20, show_default=True, help="Neighbours stored per book.")
+@with_appcontext
+def build_recommendations(top_k):
+    # Imported here so that only this command loads NumPy and SciPy, not the web workers
+    import book_similarity
+    print(f"Stored {book_similarity.build(top_k)} book neighbours")
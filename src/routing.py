@@ -0,0 +1,68 @@
+"""
+Read-replica routing.
+
+Replicas are listed in DB_REPLICA_CONNECTION_STRINGS (comma separated). While a
+GET request has not written anything, its queries go to one replica, picked at
+random once per session; writes, and every query after the first write, go to
+the primary. A write request also sets a short-lived cookie so the client's
+next reads see it.
+"""
+import os
+import random
+
+from flask import request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.sql.expression import UpdateBase
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+REPLICA_BIND_PREFIX = "replica_"
+STICKY_COOKIE = "read_primary"
+STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+
+def replica_binds(connection_strings):
+    """Builds SQLALCHEMY_BINDS entries for the replica URIs."""
+    uris = [uri.strip() for uri in (connection_strings or "").split(",") if uri.strip()]
+    return {f"{REPLICA_BIND_PREFIX}{position}": uri for position, uri in enumerate(uris)}
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def replica_keys(self):
+        return [key for key in (self.app.config.get("SQLALCHEMY_BINDS") or {}) if key.startswith(REPLICA_BIND_PREFIX)]
+
+    def reads_from_replica(self, clause):
+        if not has_request_context() or request.method not in READ_METHODS or request.cookies.get(STICKY_COOKIE):
+            return False
+        if isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        return not (self._flushing or self.info.get("wrote"))
+
+    def get_bind(self, mapper=None, clause=None):
+        replica_keys = self.replica_keys()
+        if replica_keys and self.reads_from_replica(clause):
+            # One replica per session, so every read of a request sees the same replication lag
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(replica_keys)
+            return self.db.get_engine(self.app, bind=self.info["replica"])
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+def stick_to_primary(session, flush_context):
+    session.info["wrote"] = True
+
+def set_sticky_cookie(response):
+    if request.method not in READ_METHODS and response.status_code < 400:
+        response.set_cookie(STICKY_COOKIE, "1", max_age=STICKY_SECONDS)
+    return response
+
+def init_app(app):
+    if any(key.startswith(REPLICA_BIND_PREFIX) for key in app.config.get("SQLALCHEMY_BINDS") or {}):
+        app.after_request(set_sticky_cookie)
+
+event.listen(RoutingSession, "after_flush", stick_to_primary)
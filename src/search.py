@@ -0,0 +1,184 @@
+"""
+Full-text search over books and authors.
+
+On Postgres the search runs on GIN-indexed tsvectors (see the es_unaccent text
+search configuration created by the migrations); books keep theirs in the
+generated book.search_vector column, so ranking never parses a synopsis. Any
+other database falls back to an in-process inverted index that is rebuilt when
+books or authors change. Only the last word of a query matches as a prefix, and
+only once it has SEARCH_MIN_PREFIX_LENGTH characters, so a one or two letter
+prefix doesn't match and rank most of the catalog.
+"""
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+
+from sqlalchemy import event, func, literal_column, select, union
+
+from models import db, Book, Author, written_by, STREAM_BATCH_SIZE
+
+# Postgres text search configuration: the spanish one plus unaccent
+TS_CONFIG = literal_column("'es_unaccent'")
+# Generated column added by the migrations on Postgres only, so it is not mapped on Book
+BOOK_VECTOR = literal_column("book.search_vector")
+MIN_PREFIX_LENGTH = int(os.environ.get("SEARCH_MIN_PREFIX_LENGTH", 3))
+# Seconds an in-process index is trusted before it is rebuilt, so workers pick up writes made by other workers
+INDEX_TTL = int(os.environ.get("SEARCH_INDEX_TTL", 300))
+# Field weights used to rank matches
+TITLE_WEIGHT = 3
+AUTHOR_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+TOKEN_RE = re.compile(r"\w+")
+
+def fold(text):
+    """Lowercases and strips accents, so "Histórica" and "historica" match."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text or ""))
+
+def matches_prefix(terms, position):
+    return position == len(terms) - 1 and len(terms[position]) >= MIN_PREFIX_LENGTH
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.tokens = []
+        self.doc_count = 0
+
+    def add(self, doc_id, fields):
+        """Indexes a document from (text, weight) pairs."""
+        self.doc_count += 1
+        for text, weight in fields:
+            for token in tokenize(text):
+                postings = self.postings[token]
+                postings[doc_id] = postings.get(doc_id, 0) + weight
+
+    def freeze(self):
+        # A sorted vocabulary turns prefix matching into a binary search
+        self.tokens = sorted(self.postings)
+
+    def expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self.postings else []
+        matches = []
+        for token in self.tokens[bisect_left(self.tokens, term):]:
+            if not token.startswith(term):
+                break
+            matches.append(token)
+        return matches
+
+    def search(self, query, limit):
+        """Returns the ids of the best matching documents; every word must match and the last one may be a prefix."""
+        terms = tokenize(query)
+        scores = None
+        for position, term in enumerate(terms):
+            term_scores = {}
+            for token in self.expand(term, prefix=matches_prefix(terms, position)):
+                postings = self.postings[token]
+                idf = math.log(1 + self.doc_count / len(postings))
+                for doc_id, weight in postings.items():
+                    term_scores[doc_id] = term_scores.get(doc_id, 0) + weight * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+        if not scores:
+            return []
+        return [doc_id for doc_id, score in nlargest(limit, scores.items(), key=lambda x: (x[1], -x[0]))]
+
+_lock = threading.Lock()
+_indexes = {}
+
+def invalidate(*args):
+    with _lock:
+        _indexes.clear()
+
+def build_book_index():
+    index = InvertedIndex()
+    books = db.session.query(Book.id, Book.title, Book.synopsis).yield_per(STREAM_BATCH_SIZE)
+    for book in books:
+        index.add(book.id, [(book.title, TITLE_WEIGHT), (book.synopsis, TEXT_WEIGHT)])
+    book_authors = db.session.query(written_by.c.id_book, Author.name).join(Author, Author.id == written_by.c.id_author)
+    for id_book, name in book_authors:
+        for token in tokenize(name):
+            postings = index.postings[token]
+            postings[id_book] = postings.get(id_book, 0) + AUTHOR_WEIGHT
+    index.freeze()
+    return index
+
+def build_author_index():
+    index = InvertedIndex()
+    for author in db.session.query(Author.id, Author.name).yield_per(STREAM_BATCH_SIZE):
+        index.add(author.id, [(author.name, TITLE_WEIGHT)])
+    index.freeze()
+    return index
+
+def get_index(name, build):
+    with _lock:
+        index, built_at = _indexes.get(name, (None, 0))
+    if index is None or time.time() - built_at > INDEX_TTL:
+        index = build()
+        with _lock:
+            _indexes[name] = (index, time.time())
+    return index
+
+def use_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+def to_tsquery(query):
+    terms = tokenize(query)
+    if not terms:
+        return None
+    if matches_prefix(terms, len(terms) - 1):
+        terms[-1] += ":*"
+    return func.to_tsquery(TS_CONFIG, " & ".join(terms))
+
+def author_vector():
+    return func.to_tsvector(TS_CONFIG, Author.name)
+
+def search_book_ids(query, limit):
+    if not use_postgres():
+        return get_index("books", build_book_index).search(query, limit)
+    ts_query = to_tsquery(query)
+    if ts_query is None:
+        return []
+    # Each side of the union is answered by its own GIN index (ix_book_search_vector, ix_author_search); an OR across
+    # book and author would scan every book instead. Only the matches are ranked.
+    title_matches = select([Book.id.label("id")]).where(BOOK_VECTOR.op("@@")(ts_query))
+    author_matches = select([written_by.c.id_book.label("id")]).select_from(
+        written_by.join(Author, Author.id == written_by.c.id_author)
+    ).where(author_vector().op("@@")(ts_query))
+    matching = union(title_matches, author_matches).alias("matching")
+    rank = func.max(func.ts_rank(BOOK_VECTOR, ts_query) + func.coalesce(func.ts_rank(author_vector(), ts_query), 0))
+    matches = db.session.query(Book.id).join(matching, matching.c.id == Book.id).outerjoin(written_by, written_by.c.id_book == Book.id).outerjoin(
+        Author, Author.id == written_by.c.id_author
+    ).group_by(Book.id).order_by(rank.desc(), Book.id).limit(limit)
+    return [match.id for match in matches]
+
+def search_author_ids(query, limit):
+    if not use_postgres():
+        return get_index("authors", build_author_index).search(query, limit)
+    ts_query = to_tsquery(query)
+    if ts_query is None:
+        return []
+    matches = db.session.query(Author.id).filter(author_vector().op("@@")(ts_query)).order_by(func.ts_rank(author_vector(), ts_query).desc(), Author.id).limit(limit)
+    return [match.id for match in matches]
+
+def search_books(query, limit, fields=None):
+    return Book.read_by_ids(search_book_ids(query, limit), fields)
+
+def search_authors(query, limit, fields=None):
+    return Author.read_by_ids(search_author_ids(query, limit), fields)
+
+for model in (Book, Author):
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, event_name, invalidate)
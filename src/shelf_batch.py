@@ -0,0 +1,108 @@
+"""
+Batched shelf changes for one reader, such as a library import.
+
+Operations are applied in order to the reader's current entries in memory;
+only the net difference reaches the database, as one INSERT that ignores
+existing rows and one set-based DELETE. Both run in a single transaction.
+Shelf inserts and deletes made this way skip the mapper events, so the feed
+and the reader's similarity signature are updated here, once per batch.
+"""
+from sqlalchemy import and_, tuple_
+
+import feed
+import similar_readers
+from models import db, Book, Reader, Shelf, insert_ignoring_duplicates
+from utils import APIException
+
+MAX_BATCH_ITEMS = 5000
+# Rows per statement, which keeps IN lists under every database's parameter limit
+CHUNK_SIZE = 500
+OPERATIONS = ("add", "remove", "move")
+
+shelf_table = Shelf.__table__
+SHELF_NAMES = shelf_table.c.shelf_name.type.enums
+
+def chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+def validate(item):
+    """Returns an error message for a malformed operation, or None."""
+    if not isinstance(item, dict) or item.get("op") not in OPERATIONS:
+        return f"op must be one of {', '.join(OPERATIONS)}"
+    if not isinstance(item.get("id_book"), int):
+        return "id_book must be an integer"
+    shelves = ("from", "to") if item["op"] == "move" else ("shelf_name",)
+    for key in shelves:
+        if item.get(key) not in SHELF_NAMES:
+            return f"{key} must be one of {', '.join(SHELF_NAMES)}"
+    return None
+
+def read_entries(id_reader, book_ids):
+    entries = set()
+    for book_chunk in chunks(book_ids):
+        rows = db.session.query(Shelf.id_book, Shelf.shelf_name).filter(Shelf.id_reader == id_reader, Shelf.id_book.in_(book_chunk))
+        entries.update((id_book, shelf_name) for id_book, shelf_name in rows)
+    return entries
+
+def read_existing_books(book_ids):
+    existing = set()
+    for book_chunk in chunks(book_ids):
+        existing.update(id_book for (id_book,) in db.session.query(Book.id).filter(Book.id.in_(book_chunk)))
+    return existing
+
+def apply(id_reader, items):
+    """Returns one result per item, in order, with a status of added, exists, removed, not_found, moved or invalid."""
+    if not isinstance(items, list):
+        raise APIException("operations must be a list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise APIException(f"A batch can hold at most {MAX_BATCH_ITEMS} operations")
+    if db.session.query(Reader.id).filter_by(id=id_reader).scalar() is None:
+        raise APIException("Reader not found", status_code=404)
+    errors = [validate(item) for item in items]
+    book_ids = {item["id_book"] for item, error in zip(items, errors) if error is None}
+    existing_books = read_existing_books(book_ids)
+    before = read_entries(id_reader, book_ids)
+    entries = set(before)
+    results = []
+    for item, error in zip(items, errors):
+        if error is None and item["id_book"] not in existing_books:
+            error = "book not found"
+        if error is not None:
+            item = item if isinstance(item, dict) else {}
+            results.append({"op": item.get("op"), "id_book": item.get("id_book"), "status": "invalid", "message": error})
+            continue
+        id_book = item["id_book"]
+        if item["op"] == "add":
+            entry = (id_book, item["shelf_name"])
+            status = "exists" if entry in entries else "added"
+            entries.add(entry)
+        elif item["op"] == "remove":
+            entry = (id_book, item["shelf_name"])
+            status = "removed" if entry in entries else "not_found"
+            entries.discard(entry)
+        else:
+            source, target = (id_book, item["from"]), (id_book, item["to"])
+            if source in entries:
+                status = "moved"
+            else:
+                # Nothing to move, so this is an add of the target entry
+                status = "exists" if target in entries else "added"
+            entries.discard(source)
+            entries.add(target)
+        results.append({"op": item["op"], "id_book": id_book, "status": status})
+
+    added = entries - before
+    removed = before - entries
+    connection = db.session.connection()
+    for added_chunk in chunks(added):
+        connection.execute(insert_ignoring_duplicates(shelf_table), [{"id_reader": id_reader, "id_book": id_book, "shelf_name": shelf_name} for id_book, shelf_name in added_chunk])
+    for removed_chunk in chunks(removed):
+        connection.execute(shelf_table.delete().where(and_(shelf_table.c.id_reader == id_reader, tuple_(shelf_table.c.id_book, shelf_table.c.shelf_name).in_(removed_chunk))))
+    if added:
+        feed.record_many(connection, id_reader, "shelf", [{"id_book": id_book, "shelf_name": shelf_name} for id_book, shelf_name in sorted(added)])
+    if added or removed:
+        similar_readers.refresh(connection, id_reader)
+    db.session.commit()
+    return results
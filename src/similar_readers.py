@@ -0,0 +1,154 @@
+"""
+"Readers like you": readers whose shelves hold mostly the same books.
+
+The set of books on a reader's shelves is summarised by a MinHash signature,
+which mapper events on Shelf keep up to date. Signatures are cut into
+LSH_BANDS bands, and readers whose signatures agree on a whole band share
+that band's row in reader_bucket. A reader's candidates are therefore found
+with index lookups instead of a comparison against every reader, and are
+then ranked by the Jaccard similarity their signatures estimate.
+`flask build-reader-signatures` recomputes everything after a bulk load.
+"""
+import hashlib
+import heapq
+import random
+import struct
+from collections import defaultdict
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, func, select
+from sqlalchemy.orm import aliased
+
+from models import db, Reader, ReaderBucket, ReaderSignature, Shelf, follower, STREAM_BATCH_SIZE
+
+SIGNATURE_SIZE = 64
+LSH_BANDS = 32
+ROWS_PER_BAND = SIGNATURE_SIZE // LSH_BANDS
+# Readers compared exactly per request, taken from those sharing the most bands
+MAX_CANDIDATES = 500
+PRIME = (1 << 61) - 1
+INSERT_BATCH_SIZE = 1000
+
+_random = random.Random(1813)
+HASH_PARAMETERS = [(_random.randrange(1, PRIME), _random.randrange(PRIME)) for _ in range(SIGNATURE_SIZE)]
+
+signature_table = ReaderSignature.__table__
+bucket_table = ReaderBucket.__table__
+reader_table = Reader.__table__
+
+def book_hashes(id_book):
+    return [(a * int(id_book) + b) % PRIME for a, b in HASH_PARAMETERS]
+
+def minhash(book_ids):
+    signature = [PRIME] * SIGNATURE_SIZE
+    for id_book in book_ids:
+        signature = list(map(min, signature, book_hashes(id_book)))
+    return signature
+
+def pack(signature):
+    return struct.pack(f"<{SIGNATURE_SIZE}Q", *signature)
+
+def unpack(packed):
+    return list(struct.unpack(f"<{SIGNATURE_SIZE}Q", packed))
+
+def band_buckets(signature):
+    for band in range(LSH_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f"<{ROWS_PER_BAND}Q", *rows), digest_size=8).digest()
+        yield band, int.from_bytes(digest, "big", signed=True)
+
+def estimate_similarity(signature, other_signature):
+    return sum(value == other_value for value, other_value in zip(signature, other_signature)) / SIGNATURE_SIZE
+
+def signature_rows(id_reader, signature):
+    buckets = [{"band": band, "bucket": bucket, "id_reader": id_reader} for band, bucket in band_buckets(signature)]
+    return {"id_reader": id_reader, "signature": pack(signature)}, buckets
+
+def lock_reader(connection, id_reader):
+    """Holds the reader's row until commit, so concurrent shelf changes of one reader rewrite its signature one after the other."""
+    connection.execute(select([reader_table.c.id]).where(reader_table.c.id == id_reader).with_for_update())
+
+def store(connection, id_reader, signature):
+    """Replaces the reader's signature and buckets; a reader without books is left out of the index. Call it with the reader locked."""
+    connection.execute(bucket_table.delete().where(bucket_table.c.id_reader == id_reader))
+    connection.execute(signature_table.delete().where(signature_table.c.id_reader == id_reader))
+    if signature is None:
+        return
+    signature_row, buckets = signature_rows(id_reader, signature)
+    connection.execute(signature_table.insert(), signature_row)
+    connection.execute(bucket_table.insert(), buckets)
+
+def add_book(mapper, connection, shelf):
+    lock_reader(connection, shelf.id_reader)
+    stored = connection.execute(select([signature_table.c.signature]).where(signature_table.c.id_reader == shelf.id_reader)).scalar()
+    current = unpack(stored) if stored is not None else None
+    signature = list(map(min, current or [PRIME] * SIGNATURE_SIZE, book_hashes(shelf.id_book)))
+    if signature != current:
+        store(connection, shelf.id_reader, signature)
+
+def refresh(connection, id_reader):
+    lock_reader(connection, id_reader)
+    books = connection.execute(select([Shelf.id_book]).where(Shelf.id_reader == id_reader).distinct())
+    book_ids = [id_book for (id_book,) in books]
+    store(connection, id_reader, minhash(book_ids) if book_ids else None)
+
+def remove_book(mapper, connection, shelf):
+    # A minimum can't forget a value, so the signature is recomputed from the books left on the reader's shelves
+    refresh(connection, shelf.id_reader)
+
+def similar_reader_ids(id_reader, limit):
+    """Returns [(estimated similarity, id_reader), ...], best first, leaving out readers already followed."""
+    stored = db.session.query(ReaderSignature.signature).filter_by(id_reader=id_reader).scalar()
+    if stored is None:
+        return []
+    signature = unpack(stored)
+    own_bucket = aliased(ReaderBucket)
+    followed = select([follower.c.id_followed]).where(follower.c.id_follower == id_reader)
+    candidates = db.session.query(ReaderBucket.id_reader).join(
+        own_bucket, and_(own_bucket.band == ReaderBucket.band, own_bucket.bucket == ReaderBucket.bucket)
+    ).filter(
+        own_bucket.id_reader == id_reader, ReaderBucket.id_reader != id_reader, ~ReaderBucket.id_reader.in_(followed)
+    ).group_by(ReaderBucket.id_reader).order_by(func.count().desc()).limit(MAX_CANDIDATES)
+    candidate_ids = [candidate for (candidate,) in candidates]
+    if not candidate_ids:
+        return []
+    signatures = db.session.query(ReaderSignature.id_reader, ReaderSignature.signature).filter(ReaderSignature.id_reader.in_(candidate_ids))
+    scores = ((estimate_similarity(signature, unpack(other_signature)), other_reader) for other_reader, other_signature in signatures)
+    return heapq.nlargest(limit, scores)
+
+def similar_readers(id_reader, limit):
+    similarities = {other_reader: similarity for similarity, other_reader in similar_reader_ids(id_reader, limit)}
+    readers = Reader.read_by_ids(list(similarities), Reader.public_schema)
+    for reader in readers:
+        reader["similarity"] = round(similarities[reader["id"]], 4)
+    return readers
+
+def read_book_sets():
+    books_by_reader = defaultdict(set)
+    for id_reader, id_book in db.session.query(Shelf.id_reader, Shelf.id_book).yield_per(STREAM_BATCH_SIZE):
+        books_by_reader[id_reader].add(id_book)
+    return books_by_reader
+
+def rebuild():
+    signatures = []
+    buckets = []
+    for id_reader, book_ids in read_book_sets().items():
+        signature_row, reader_buckets = signature_rows(id_reader, minhash(book_ids))
+        signatures.append(signature_row)
+        buckets.extend(reader_buckets)
+    db.session.execute(bucket_table.delete())
+    db.session.execute(signature_table.delete())
+    for table, rows in ((signature_table, signatures), (bucket_table, buckets)):
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.session.execute(table.insert(), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return len(signatures)
+
+@click.command("build-reader-signatures")
+@with_appcontext
+def build_reader_signatures():
+    print(f"Indexed {rebuild()} readers")
+
+event.listen(Shelf, "after_insert", add_book)
+event.listen(Shelf, "after_delete", remove_book)
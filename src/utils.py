@@ -1,4 +1,14 @@
-from flask import jsonify, url_for
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, url_for, json, Response, stream_with_context
+from sqlalchemy import event
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON_MIMETYPE = "application/x-ndjson"
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +25,81 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+MAX_PAGE_SIZE = 100
+
+def dumps(data):
+    """Encodes plain rows to JSON, with orjson when it is installed and Flask's encoder otherwise."""
+    started = time.perf_counter()
+    if orjson is not None:
+        encoded = orjson.dumps(data, default=json.JSONEncoder().default)
+    else:
+        encoded = json.dumps(data, separators=(",", ":"))
+    # Reported by instrumentation; rows encoded while a streamed response is sent come after the report
+    if has_request_context():
+        g.serialize_time = g.get("serialize_time", 0) + time.perf_counter() - started
+    return encoded
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype="application/json")
+
+def get_page_args(args):
+    """Returns (limit, after) when the request asks for a page, or None to list everything."""
+    if "limit" not in args and "after" not in args:
+        return None
+    try:
+        limit = int(args.get("limit", MAX_PAGE_SIZE))
+        after = int(args["after"]) if args.get("after") else None
+    except ValueError:
+        raise APIException("limit and after must be integers")
+    if limit < 1:
+        raise APIException("limit must be greater than 0")
+    return min(limit, MAX_PAGE_SIZE), after
+
+def get_fields(args, allowed):
+    """Returns the fields asked for with ?fields=a,b (always with "id"), or None for every field."""
+    if not args.get("fields"):
+        return None
+    fields = [field.strip() for field in args["fields"].split(",") if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIException(f"unknown fields: {', '.join(unknown)}")
+    return ("id",) + tuple(field for field in fields if field != "id")
+
+def page_response(items, limit):
+    # Rows are ordered by "id"; a full page means there may be more after the last one
+    ids = set(item["id"] for item in items)
+    next_cursor = items[-1]["id"] if len(ids) >= limit else None
+    return json_response({"results": items, "next_cursor": next_cursor})
+
+def get_stream_format(request):
+    """Returns "ndjson" or "json" when the client asks for a streamed export, otherwise None."""
+    stream = request.args.get("stream")
+    if stream == "ndjson" or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return "ndjson"
+    if stream in ("1", "true", "json"):
+        return "json"
+    return None
+
+def stream_response(rows, stream_format):
+    # Rows are encoded one at a time as they come off the cursor, so nothing holds the whole table
+    def generate_ndjson():
+        for row in rows:
+            yield dumps(row)
+            yield "\n"
+
+    def generate_json_array():
+        yield "["
+        separator = ""
+        for row in rows:
+            yield separator
+            yield dumps(row)
+            separator = ","
+        yield "]"
+
+    if stream_format == "ndjson":
+        return Response(stream_with_context(generate_ndjson()), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(generate_json_array()), mimetype="application/json")
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -40,24 +125,24 @@ def generate_sitemap(app):
         <p>Remember to specify a real endpoint path like: </p>
         <ul style="text-align: left;">"""+links_html+"</ul></div>"
 
-def token_required(f):
-    @wraps(f)
-    def decorator(*args, **kwargs):
-
-        token = None
-
-        if 'x-access-tokens' in request.headers:
-            token = request.headers['x-access-tokens']
-
-        if not token:
-            return jsonify({'message': 'a valid token is missing'})
+@contextmanager
+def count_queries(engine):
+    """Collects every SQL statement the engine executes inside the block."""
+    statements = []
 
-        try:
-            data = jwt.decode(token, app.config[SECRET_KEY])
-            current_reader = Reader.query.filter_by(id=data['id']).first()
-        except:
-            return jsonify({'message': 'token is invalid'})
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
 
-        return f(current_reader, *args, **kwargs)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
 
-    return decorator
+@contextmanager
+def assert_max_queries(engine, max_queries):
+    """Fails when the block runs more than max_queries statements, e.g. around a test client call."""
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > max_queries:
+        raise AssertionError(f"{len(statements)} queries executed, expected at most {max_queries}:\n" + "\n".join(statements))